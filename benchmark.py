@@ -0,0 +1,561 @@
+"""Бенчмарки распознавания на WAV-файлах
+
+Пример:
+    python benchmark.py pipeline --lengths 2 5 15 --stub-vosk
+    python benchmark.py pipeline --wav samples/short.wav samples/long.wav
+    python benchmark.py parallel --wav samples/dictation.wav
+    python benchmark.py vad --wav samples/dictation.wav
+    python benchmark.py merge --words 100 400 1600
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import yaml
+
+import main as app
+from main import AudioTranscriber, Resampler, STAGE_NAMES, detect_speech, merge_by_time, read_wav
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса с момента запуска, МБ (вместе с моделями Vosk/Kaldi); None, если узнать нечем"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдает килобайты, macOS - байты
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def measure(func, repeat):
+    """Время выполнения func() в секундах для каждого повтора"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_parallel(args):
+    """Последовательное vs параллельное декодирование RU/EN"""
+    transcriber = AudioTranscriber(interactive=False)
+    sample_rate = transcriber.config['vosk']['sample_rate']
+    audio_data = read_wav(args.wav, sample_rate)
+    duration = len(audio_data) / 2 / sample_rate
+    print(f"🎧 {args.wav}: {duration:.1f} с аудио")
+    
+    for mode in args.modes:
+        # Прогрев: создание пулов и загрузка моделей в процессах не должны попадать в замер
+        transcriber.decode_vosk(audio_data, parallel=mode)
+        timings = measure(lambda: transcriber.decode_vosk(audio_data, parallel=mode), args.repeat)
+        median = statistics.median(timings)
+        print(f"⏱️ {mode:>8}: медиана {median:.3f} с, мин {min(timings):.3f} с, RTF {median / duration:.3f}")
+
+
+def bench_vad(args):
+    """Сколько сэмплов отбрасывает VAD и сколько времени декодирования это экономит"""
+    transcriber = AudioTranscriber(interactive=False)
+    sample_rate = transcriber.config['vosk']['sample_rate']
+    audio_data = read_wav(args.wav, sample_rate)
+    total = len(audio_data) // 2
+    
+    timings = measure(lambda: detect_speech(audio_data, sample_rate), args.repeat)
+    spans = detect_speech(audio_data, sample_rate)
+    kept = sum(end - start for start, end in spans)
+    print(f"✂️ VAD: {len(spans)} фраз, отброшено {total - kept} из {total} сэмплов "
+          f"({100 * (total - kept) / max(total, 1):.0f}%), анализ {1000 * min(timings):.1f} мс")
+    
+    without_vad = measure(lambda: transcriber.decode_vosk(audio_data, vad=False), args.repeat)
+    with_vad = measure(lambda: transcriber.decode_vosk(audio_data, vad=True), args.repeat)
+    saved = statistics.median(without_vad) - statistics.median(with_vad)
+    print(f"⏱️ Декодирование без VAD: {statistics.median(without_vad):.3f} с, "
+          f"с VAD: {statistics.median(with_vad):.3f} с, экономия {saved:.3f} с")
+
+
+def bench_resample(args):
+    """Пропускная способность приведения к mono и частоте движка: потоково чанками по 64 мс и целиком"""
+    source = synthetic_speech(args.seconds, args.rate)
+    samples = np.frombuffer(source, dtype=np.int16)
+    audio_data = np.repeat(samples, args.channels).tobytes()
+    chunk = args.rate * 64 // 1000 * args.channels * 2
+    
+    def streamed():
+        resampler = Resampler(args.rate, args.target, args.channels)
+        for i in range(0, len(audio_data), chunk):
+            resampler.process(audio_data[i:i + chunk])
+    
+    print(f"🎚️ {args.seconds} с, {args.rate} Гц x {args.channels} -> {args.target} Гц mono")
+    for name, func in (("чанками", streamed),
+                       ("целиком", lambda: Resampler(args.rate, args.target, args.channels).process(audio_data))):
+        best = min(measure(func, args.repeat))
+        print(f"   {name:>8}: {best * 1000:7.1f} мс, {args.seconds / best:7.0f}x реального времени, "
+              f"{len(audio_data) / best / 1024 / 1024:6.0f} МБ/с")
+
+
+def synthetic_transcript(n_words, seed=0):
+    """Пара гипотез RU/EN из n_words слов со сдвинутыми границами и случайной уверенностью"""
+    rng = random.Random(seed)
+    words_ru, words_en = [], []
+    t = 0.0
+    for i in range(n_words):
+        duration = rng.uniform(0.2, 0.6)
+        words_ru.append({'word': f'слово{i}', 'start': t, 'end': t + duration, 'conf': rng.random()})
+        if rng.random() < 0.2:
+            # Английская модель разбила слово на два
+            middle = t + duration / 2 + rng.uniform(-0.05, 0.05)
+            words_en.append({'word': f'word{i}a', 'start': t, 'end': middle, 'conf': rng.random()})
+            words_en.append({'word': f'word{i}b', 'start': middle, 'end': t + duration, 'conf': rng.random()})
+        elif rng.random() > 0.05:
+            jitter = rng.uniform(-0.05, 0.05)
+            words_en.append({'word': f'word{i}', 'start': t + jitter, 'end': t + duration + jitter, 'conf': rng.random()})
+        t += duration + rng.uniform(0.0, 0.2)
+    return words_ru, words_en
+
+
+def bench_merge(args):
+    """Совмещение гипотез по времени на длинных транскриптах"""
+    for n_words in args.words:
+        words_ru, words_en = synthetic_transcript(n_words)
+        timings = measure(lambda: merge_by_time(words_ru, words_en), args.repeat)
+        best = min(timings)
+        print(f"⏱️ {n_words:>6} слов: {1000 * best:.2f} мс, {1e6 * best / n_words:.2f} мкс/слово")
+
+
+def synthetic_speech(seconds, sample_rate, seed=0):
+    """Похожий на речь сигнал: фразы из гармоник с огибающей слогов, разделенные паузами"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    signal = rng.normal(0, 40, n)
+    position = int(0.5 * sample_rate)
+    while position < n:
+        length = min(int(rng.uniform(0.8, 3.0) * sample_rate), n - position)
+        phrase_t = t[:length]
+        pitch = rng.uniform(100, 220)
+        voice = sum(np.sin(2 * np.pi * pitch * k * phrase_t) / k for k in range(1, 6))
+        syllables = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 6) * phrase_t)
+        signal[position:position + length] += 4000 * voice * syllables
+        position += length + int(rng.uniform(0.3, 1.2) * sample_rate)
+    return np.clip(signal, -32768, 32767).astype(np.int16).tobytes()
+
+
+class FakeStream:
+    """Входной поток PyAudio, отдающий аудио, загруженное в FakeAudio"""
+    
+    def __init__(self, source, rate, frames_per_buffer, stream_callback=None):
+        self.source = source
+        self.rate = rate
+        self.active = True
+        self.thread = None
+        if stream_callback:
+            # Режим callback: поток сам отдает чанки, пока его не закроют
+            self.thread = threading.Thread(target=self._run, args=(stream_callback, frames_per_buffer), daemon=True)
+            self.thread.start()
+    
+    def _run(self, callback, frames):
+        while self.active:
+            _, flag = callback(self.read(frames), frames, None, 0)
+            if flag != app.PA_CONTINUE:
+                break
+    
+    def read(self, frames, exception_on_overflow=True):
+        source = self.source
+        size = frames * 2
+        with source.lock:
+            chunk = source.audio_data[source.position:source.position + size]
+            source.position += len(chunk)
+            generation = source.generation
+        if source.realtime or not chunk:
+            time.sleep(frames / self.rate)
+        if len(chunk) < size:
+            # Аудио закончилось: дальше тишина, пока запись не остановят
+            with source.lock:
+                if generation == source.generation:
+                    source.done.set()
+            chunk += bytes(size - len(chunk))
+        return chunk
+    
+    def stop_stream(self):
+        self.active = False
+        if self.thread:
+            self.thread.join()
+    
+    def close(self):
+        pass
+
+
+class FakeAudio:
+    """Замена pyaudio.PyAudio для машин без звуковой карты"""
+    
+    def __init__(self, realtime=True, rate=16000, channels=1):
+        self.realtime = realtime
+        self.rate = rate
+        self.channels = channels
+        self.audio_data = b''
+        self.position = 0
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.generation = 0
+    
+    def load(self, audio_data):
+        with self.lock:
+            self.audio_data = audio_data
+            self.position = 0
+            self.generation += 1
+            self.done.clear()
+    
+    def open(self, rate, frames_per_buffer=1024, stream_callback=None, **kwargs):
+        return FakeStream(self, rate, frames_per_buffer, stream_callback)
+    
+    def get_default_input_device_info(self):
+        return {'defaultSampleRate': float(self.rate), 'maxInputChannels': self.channels}
+    
+    def get_sample_size(self, sample_format):
+        return 2
+    
+    def terminate(self):
+        pass
+
+
+class FakeWindows:
+    """Окна без Windows: фокус переходит через focus_delay, как у настоящего SetForegroundWindow"""
+    
+    def __init__(self, focus_delay=0.02):
+        self.focus_delay = focus_delay
+        self.current = 1
+        self.pending = None
+    
+    def foreground(self):
+        if self.pending and time.perf_counter() >= self.pending[1]:
+            self.current = self.pending[0]
+            self.pending = None
+        return self.current
+    
+    def activate(self, hwnd):
+        self.pending = (hwnd, time.perf_counter() + self.focus_delay)
+        return True
+    
+    def switch_previous(self):
+        self.activate(self.current + 1)
+
+
+class FakeClipboard:
+    """Буфер обмена в памяти с задержкой обновления"""
+    
+    def __init__(self, delay=0.005):
+        self.delay = delay
+        self.text = ''
+        self.ready_at = 0
+        self.pending = ''
+    
+    def get(self):
+        if time.perf_counter() >= self.ready_at:
+            self.text = self.pending
+        return self.text
+    
+    def set(self, text):
+        self.pending = text
+        self.ready_at = time.perf_counter() + self.delay
+
+
+class FakeKeyboard:
+    """Собирает вставленный и набранный текст"""
+    
+    def __init__(self, clipboard):
+        self.clipboard = clipboard
+        self.inserted = []
+    
+    def paste(self):
+        self.inserted.append(self.clipboard.get())
+    
+    def type(self, text):
+        self.inserted.append(text)
+    
+    def modifiers_pressed(self):
+        return False
+
+
+class StubModel:
+    """Заглушка vosk.Model: проверяет скорость конвейера без настоящих моделей"""
+    
+    def __init__(self, path):
+        self.path = path
+
+
+class StubRecognizer:
+    """Заглушка KaldiRecognizer: одно слово на каждую секунду аудио"""
+    
+    def __init__(self, model, sample_rate):
+        self.english = 'en' in os.path.basename(model.path)
+        self.sample_rate = sample_rate
+        self.Reset()
+    
+    def SetWords(self, enabled):
+        pass
+    
+    def Reset(self):
+        self.seconds = 0.0
+        self.words = []
+    
+    def AcceptWaveform(self, data):
+        before = int(self.seconds)
+        self.seconds += len(data) / 2 / self.sample_rate
+        if int(self.seconds) > before:
+            word = 'docker' if self.english else 'докер'
+            self.words.append({'word': word, 'start': self.seconds - 0.5, 'end': self.seconds, 'conf': 0.9})
+        return len(self.words) >= 3
+    
+    def _result(self):
+        words, self.words = self.words, []
+        return json.dumps({'text': ' '.join(w['word'] for w in words), 'result': words})
+    
+    def Result(self):
+        return self._result()
+    
+    def FinalResult(self):
+        return self._result()
+    
+    def PartialResult(self):
+        return json.dumps({'partial': ''})
+
+
+def start_stub_server(latency):
+    """Локальная замена DeepSeek и Google Speech с заданной задержкой ответа"""
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        
+        def _read_body(self):
+            if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+                return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            # Потоковая отправка: тело приходит чанками, пока идет запись
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return body
+        
+        def do_POST(self):
+            body = self._read_body()
+            too_long = False
+            if 'speech:recognize' in self.path:
+                request = json.loads(body)
+                encoding, size = request['config']['encoding'], len(base64.b64decode(request['audio']['content']))
+                received.append((encoding, size))
+                # Как и Google, синхронный speech:recognize не принимает больше минуты аудио
+                too_long = encoding == 'LINEAR16' and size / 2 / request['config']['sampleRateHertz'] > 60
+            time.sleep(latency)
+            if too_long:
+                self._reply(400, {'error': {'message': 'Sync input too long'}})
+                return
+            if 'chat/completions' in self.path:
+                self._reply(200, {'choices': [{'message': {'content': 'stub'}}]})
+            else:
+                self._reply(200, {'results': [{'alternatives': [{'transcript': 'stub'}]}]})
+        
+        def log_message(self, *args):
+            pass
+    
+    received = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.received = received
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def merge_config(base, overrides):
+    """Рекурсивно наложить overrides на base"""
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge_config(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def bench_pipeline(args):
+    """Сквозной прогон: фейковый микрофон -> распознавание -> комбинирование -> вставка (заглушка)"""
+    server = start_stub_server(args.api_latency_ms / 1000)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'bench')
+    os.environ.setdefault('GOOGLE_API_KEY', 'bench')
+    
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    overrides = {
+        'deepseek': {'url': f"{base_url}/v1/chat/completions", 'cache': {'enabled': False}},
+        'google': {'url': f"{base_url}/v1/speech:recognize", 'upload': args.google_upload, 'encoding': args.google_encoding},
+        'vosk': {'background_load': False},
+        'feedback': {'backend': 'none'},
+        'audio': {'persistent': args.persistent}
+    }
+    if args.engine:
+        overrides['engine'] = args.engine
+    if args.stub_vosk:
+        app.Model = StubModel
+        app.KaldiRecognizer = StubRecognizer
+        # Пути должны существовать, чтобы загрузчик принял "модели"
+        stub_paths = {lang: os.path.join(tempfile.gettempdir(), f'stub-model-{lang}') for lang in ('ru', 'en')}
+        for path in stub_paths.values():
+            os.makedirs(path, exist_ok=True)
+        overrides['vosk'].update({'model_path': stub_paths['ru'], 'model_path_en': stub_paths['en']})
+    merge_config(config, overrides)
+    
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False, encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+        config_path = f.name
+    
+    sample_rate = config['vosk']['sample_rate'] if config['engine'] == 'vosk' else config['google'].get('sample_rate', 16000)
+    device_rate = args.device_rate or sample_rate
+    audio = FakeAudio(realtime=not args.fast, rate=device_rate, channels=args.device_channels)
+    transcriber = AudioTranscriber(audio=audio, config_path=config_path)
+    clipboard = FakeClipboard()
+    transcriber.inserter = app.TextInserter(FakeWindows(), clipboard, FakeKeyboard(clipboard), transcriber.config.get('insert', {}))
+    
+    def to_device(audio_data):
+        # Фейковый микрофон отдает аудио в "родном" формате устройства
+        samples = np.frombuffer(Resampler(sample_rate, device_rate).process(audio_data), dtype=np.int16)
+        return np.repeat(samples, args.device_channels).tobytes()
+    
+    fixtures = [(path, read_wav(path, sample_rate)) for path in args.wav]
+    fixtures += [(f"synthetic {seconds} с", synthetic_speech(seconds, sample_rate)) for seconds in args.lengths]
+    fixtures = [(name, audio_data, to_device(audio_data)) for name, audio_data in fixtures]
+    
+    tracemalloc.start()
+    try:
+        for name, audio_data, device_data in fixtures:
+            duration = len(audio_data) / 2 / sample_rate
+            stages = {}
+            totals = []
+            peaks = []
+            for _ in range(args.repeat):
+                tracemalloc.reset_peak()
+                if args.persistent:
+                    # Микрофон уже открыт: речь начинается после нажатия клавиши
+                    transcriber.start_listening()
+                    audio.load(device_data)
+                else:
+                    audio.load(device_data)
+                    transcriber.start_listening()
+                if not transcriber.is_recording:
+                    print("❌ Запись не началась, бенчмарк остановлен")
+                    return
+                audio.done.wait()
+                transcriber.stop_listening()
+                transcriber.jobs.join()
+                
+                timer = transcriber.stage_timer
+                for stage, elapsed in timer.stages:
+                    stages.setdefault(stage, []).append(elapsed * 1000)
+                totals.append((timer.last - timer.start) * 1000)
+                peaks.append(tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+            
+            print(f"\n🎧 {name}: {duration:.1f} с аудио, {args.repeat} прогонов")
+            for stage, values in stages.items():
+                print(f"   {STAGE_NAMES.get(stage, stage):>15}: p50 {percentile(values, 50):7.1f} мс, p95 {percentile(values, 95):7.1f} мс")
+            print(f"   {'итого':>15}: p50 {percentile(totals, 50):7.1f} мс, p95 {percentile(totals, 95):7.1f} мс, "
+                  f"RTF {percentile(totals, 50) / 1000 / duration:.3f}, пик памяти Python {max(peaks):.1f} МБ")
+            rss = peak_rss_mb()
+            if rss is not None:
+                # tracemalloc не видит память моделей и распознавателей Vosk/Kaldi: пик всего процесса
+                print(f"   {'память':>15}: пиковый RSS процесса {rss:.0f} МБ (с начала запуска)")
+            if server.received:
+                encoding, size = server.received[-1]
+                print(f"   {'Google':>15}: {encoding}, {size / 1024:.0f} КБ аудио на запрос, "
+                      f"запросов {len(server.received) / args.repeat:.0f} на запись")
+                server.received.clear()
+    finally:
+        tracemalloc.stop()
+        transcriber.close_input()
+        server.shutdown()
+        os.remove(config_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки распознавания")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    parallel = subparsers.add_parser('parallel', help="Последовательное vs параллельное декодирование")
+    parallel.add_argument('--wav', required=True, help="WAV-файл (16-bit, любая частота и число каналов)")
+    parallel.add_argument('--repeat', type=int, default=5)
+    parallel.add_argument('--modes', nargs='+', default=['off', 'thread', 'process'])
+    parallel.set_defaults(func=bench_parallel)
+    
+    vad = subparsers.add_parser('vad', help="Обрезка тишины: отброшенные сэмплы и экономия декодирования")
+    vad.add_argument('--wav', required=True, help="WAV-файл (16-bit, любая частота и число каналов)")
+    vad.add_argument('--repeat', type=int, default=5)
+    vad.set_defaults(func=bench_vad)
+    
+    resample = subparsers.add_parser('resample', help="Скорость приведения к mono и частоте движка")
+    resample.add_argument('--seconds', type=float, default=60)
+    resample.add_argument('--rate', type=int, default=48000, help="Частота микрофона")
+    resample.add_argument('--channels', type=int, default=2, help="Каналы микрофона")
+    resample.add_argument('--target', type=int, default=16000, help="Частота движка")
+    resample.add_argument('--repeat', type=int, default=5)
+    resample.set_defaults(func=bench_resample)
+    
+    merge = subparsers.add_parser('merge', help="Совмещение гипотез RU/EN по времени слов")
+    merge.add_argument('--words', type=int, nargs='+', default=[100, 200, 400, 800, 1600, 3200])
+    merge.add_argument('--repeat', type=int, default=20)
+    merge.set_defaults(func=bench_merge)
+    
+    pipeline = subparsers.add_parser('pipeline', help="Сквозная задержка по этапам на фейковом микрофоне")
+    pipeline.add_argument('--wav', nargs='*', default=[], help="Записанные WAV-файлы (16-bit, любая частота и число каналов)")
+    pipeline.add_argument('--lengths', type=float, nargs='*', default=[2, 5, 15],
+                          help="Длительности синтетических записей, с")
+    pipeline.add_argument('--repeat', type=int, default=3)
+    pipeline.add_argument('--config', default='config.yaml')
+    pipeline.add_argument('--engine', choices=['vosk', 'google'])
+    pipeline.add_argument('--api-latency-ms', type=float, default=300, help="Задержка заглушек DeepSeek/Google")
+    pipeline.add_argument('--stub-vosk', action='store_true', help="Заглушки вместо моделей Vosk")
+    pipeline.add_argument('--fast', action='store_true', help="Отдавать аудио быстрее реального времени")
+    pipeline.add_argument('--persistent', action='store_true', help="Постоянно открытый поток с предзаписью")
+    pipeline.add_argument('--device-rate', type=int, help="Родная частота фейкового микрофона (по умолчанию частота движка)")
+    pipeline.add_argument('--google-upload', choices=['single', 'stream'], default='single',
+                          help="Отправка в Google одним запросом или чанками во время записи")
+    pipeline.add_argument('--google-encoding', choices=['LINEAR16', 'FLAC', 'OGG_OPUS'], default='LINEAR16')
+    pipeline.add_argument('--device-channels', type=int, default=1, help="Число каналов фейкового микрофона")
+    pipeline.set_defaults(func=bench_pipeline)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,1791 @@
-import pyaudio
 import wave
 import threading
-import keyboard  # Изменено с pynput на keyboard
-import pyautogui
+import queue
+import time
+import sys
+import argparse
+import socket
+import weakref
+import tempfile
+import atexit
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import pyperclip
 import io
 import base64
 import requests
-import winsound
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 import os
 import json
 import yaml
+from collections import OrderedDict, namedtuple
+import numpy as np
 from dotenv import load_dotenv
 from vosk import Model, KaldiRecognizer
 
 # Загрузить переменные окружения
 load_dotenv()
 
+# pyaudio.paInt16: формат задается без импорта PyAudio (его нет в пакетном режиме и бенчмарках)
+PA_INT16 = 8
+PA_CONTINUE = 0
 
-class AudioTranscriber:
+# Тихий режим: без вывода в консоль, только метрики
+QUIET = False
+
+
+def log(message):
+    """Вывод в консоль, отключаемый настройкой metrics.quiet"""
+    if not QUIET:
+        print(message)
+
+
+class Metrics:
+    """Счетчики и гистограммы задержек горячего пути с подключаемыми приемниками"""
+    
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.sinks = []
+    
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+    
+    def _emit(self, kind, name, value, labels):
+        for sink in self.sinks:
+            try:
+                sink.event(kind, name, value, labels)
+            except Exception:
+                pass
+    
+    def count(self, name, value=1, **labels):
+        """Увеличить счетчик"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._emit('counter', name, value, labels)
+    
+    def gauge(self, name, value, **labels):
+        """Установить текущее значение (глубина очереди и т.п.)"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+        self._emit('gauge', name, value, labels)
+    
+    def observe(self, name, seconds, **labels):
+        """Записать длительность в гистограмму"""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(self.BUCKETS)}
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+        self._emit('timer', name, seconds, labels)
+    
+    @contextmanager
+    def timer(self, name, **labels):
+        """Замерить блок кода: with metrics.timer('decode_seconds'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def render_prometheus(self):
+        """Текстовый формат Prometheus"""
+        def label_text(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in list(labels) + list(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+        
+        lines = []
+        declared = set()
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE microphone_{name} counter")
+                lines.append(f"microphone_{name}{label_text(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE microphone_{name} gauge")
+                lines.append(f"microphone_{name}{label_text(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE microphone_{name} histogram")
+                # Корзины уже накопительные: значение попадает во все корзины с границей >= него
+                for bound, bucket in zip(self.BUCKETS, histogram['buckets']):
+                    lines.append(f"microphone_{name}_bucket{label_text(labels, [('le', bound)])} {bucket}")
+                lines.append(f"microphone_{name}_bucket{label_text(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"microphone_{name}_sum{label_text(labels)} {histogram['sum']:.6f}")
+                lines.append(f"microphone_{name}_count{label_text(labels)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+class JsonLogSink:
+    """Приемник метрик: каждое событие - строка JSON в файле"""
+    
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8', buffering=1)
+        self.host = socket.gethostname()
+        self.lock = threading.Lock()
+    
+    def event(self, kind, name, value, labels):
+        record = {'ts': time.time(), 'host': self.host, 'type': kind, 'name': name, 'value': value}
+        if labels:
+            record['labels'] = labels
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class PrometheusFileSink:
+    """Приемник метрик: периодически переписывает файл в формате Prometheus (textfile collector)"""
+    
+    def __init__(self, metrics, path, interval=15):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def event(self, kind, name, value, labels):
+        pass
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(self.metrics.render_prometheus())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                log(f"⚠️ Не удалось записать метрики: {e}")
+
+
+class PrometheusHTTPSink:
+    """Приемник метрик: локальный HTTP-эндпоинт /metrics"""
+    
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        sink = self
+        self.metrics = metrics
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = sink.metrics.render_prometheus().encode('utf-8')
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def event(self, kind, name, value, labels):
+        pass
+
+
+metrics = Metrics()
+
+
+def configure_metrics(metrics_config):
+    """Включить тихий режим и приемники метрик по настройкам metrics из config.yaml"""
+    global QUIET
+    QUIET = metrics_config.get('quiet', False)
+    if metrics.sinks:
+        return
+    try:
+        if metrics_config.get('json_log'):
+            metrics.sinks.append(JsonLogSink(metrics_config['json_log']))
+        if metrics_config.get('prometheus_file'):
+            metrics.sinks.append(PrometheusFileSink(
+                metrics, metrics_config['prometheus_file'], metrics_config.get('prometheus_interval', 15)
+            ))
+        if metrics_config.get('prometheus_port'):
+            metrics.sinks.append(PrometheusHTTPSink(metrics, metrics_config['prometheus_port']))
+    except Exception as e:
+        print(f"⚠️ Не удалось включить экспорт метрик: {e}")
+
+
+def detect_speech(audio_data, sample_rate, frame_ms=30, threshold_ratio=3.0, min_rms=300,
+                  padding_ms=300, min_silence_ms=600):
+    """Найти участки речи по энергии кадров: список (start, end) в сэмплах"""
+    samples = np.frombuffer(audio_data, dtype=np.int16)
+    frame_len = sample_rate * frame_ms // 1000
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return []
+    
+    # RMS каждого кадра одной векторной операцией
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    
+    # Порог относительно уровня шума (нижний дециль), но не ниже абсолютного минимума
+    threshold = max(np.percentile(rms, 10) * threshold_ratio, min_rms)
+    voiced = rms > threshold
+    if not voiced.any():
+        return []
+    
+    edges = np.diff(voiced.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    # Объединить участки, разделенные короткими паузами
+    padding = padding_ms // frame_ms
+    min_gap = max(min_silence_ms // frame_ms, 2 * padding)
+    keep = (starts[1:] - ends[:-1]) >= min_gap
+    starts = starts[np.r_[True, keep]]
+    ends = ends[np.r_[keep, True]]
+    
+    # Добавить запас вокруг речи, чтобы не обрезать начала и концы слов
+    starts = np.maximum(starts - padding, 0) * frame_len
+    ends = np.minimum((ends + padding) * frame_len, len(samples))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def merge_segment_results(parts):
+    """Склеить результаты сегментов, сдвинув временные метки слов: (text, words)"""
+    texts = []
+    words = []
+    for offset, (text, segment_words) in parts:
+        if text:
+            texts.append(text)
+        for word in segment_words:
+            word = dict(word)
+            word['start'] = word.get('start', 0) + offset
+            word['end'] = word.get('end', 0) + offset
+            words.append(word)
+    return ' '.join(texts), words
+
+
+def merge_by_time(words_ru, words_en, min_overlap=0.5):
+    """Совместить гипотезы RU/EN по временным интервалам слов
+    
+    Слова, перекрывающиеся по времени (не меньше min_overlap от более короткого),
+    образуют группу; в каждой группе целиком берется вариант с большей средней
+    уверенностью. Один проход по отсортированным спискам: O(n + m).
+    """
+    words = list(words_ru) + list(words_en)
+    parent = list(range(len(words)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    # Найти пересечения двумя указателями: слова каждой модели идут по порядку и не перекрываются
+    offset = len(words_ru)
+    j = 0
+    for i, word_ru in enumerate(words_ru):
+        start_ru, end_ru = word_ru.get('start', 0), word_ru.get('end', 0)
+        while j < len(words_en) and words_en[j].get('end', 0) <= start_ru:
+            j += 1
+        k = j
+        while k < len(words_en) and words_en[k].get('start', 0) < end_ru:
+            start_en, end_en = words_en[k].get('start', 0), words_en[k].get('end', 0)
+            overlap = min(end_ru, end_en) - max(start_ru, start_en)
+            shortest = min(end_ru - start_ru, end_en - start_en)
+            if shortest > 0 and overlap >= min_overlap * shortest:
+                parent[find(offset + k)] = find(i)
+            k += 1
+    
+    groups = {}
+    for i in range(len(words)):
+        groups.setdefault(find(i), []).append(i)
+    
+    result = []
+    for members in sorted(groups.values(), key=lambda m: min(words[i].get('start', 0) for i in m)):
+        group_ru = [words[i] for i in members if i < offset]
+        group_en = [words[i] for i in members if i >= offset]
+        if group_ru and group_en:
+            conf_ru = sum(w.get('conf', 0) for w in group_ru) / len(group_ru)
+            conf_en = sum(w.get('conf', 0) for w in group_en) / len(group_en)
+            chosen = group_en if conf_en > conf_ru else group_ru
+        else:
+            chosen = group_ru or group_en
+        result.extend(w.get('word', '') for w in sorted(chosen, key=lambda w: w.get('start', 0)))
+    
+    return ' '.join(result)
+
+
+class Resampler:
+    """Потоковое приведение int16 к моно и нужной частоте на NumPy: состояние переносится между чанками"""
+    
+    def __init__(self, in_rate, out_rate, channels=1):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.channels = channels
+        self.step = in_rate / out_rate
+        # При понижении частоты ФНЧ (sinc с окном Кайзера) срезает все выше новой частоты Найквиста,
+        # иначе эти частоты наложатся на речевую полосу; срез с запасом на ширину переходной полосы
+        if self.step > 1:
+            self.taps = int(32 * self.step) | 1
+            cutoff = 0.85 * 0.5 / self.step
+            n = np.arange(self.taps) - (self.taps - 1) / 2
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(self.taps, 8.6)
+            self.kernel = (kernel / kernel.sum()).astype(np.float32)
+        else:
+            self.taps = 1
+            self.kernel = None
+        self.history = np.zeros(0, dtype=np.float32)
+        self.position = 0.0
+    
+    @property
+    def passthrough(self):
+        return self.in_rate == self.out_rate and self.channels == 1
+    
+    def process(self, data):
+        """Преобразовать очередной чанк; выход может быть на отсчет длиннее или короче соседних"""
+        if self.passthrough:
+            return bytes(data)
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.channels > 1:
+            frames = len(samples) // self.channels
+            samples = samples[:frames * self.channels].reshape(frames, self.channels).mean(axis=1, dtype=np.float32)
+        x = np.concatenate((self.history, samples.astype(np.float32, copy=False)))
+        if len(x) < self.taps:
+            # Фильтру не хватает отсчетов: накопить до следующего чанка
+            self.history = x
+            return b''
+        smoothed = np.convolve(x, self.kernel, mode='valid') if self.taps > 1 else x
+        
+        # Линейная интерполяция в точках position + k * step, пока справа есть соседний отсчет
+        last = len(smoothed) - 1
+        count = int(np.ceil((last - self.position) / self.step)) if last > self.position else 0
+        points = self.position + np.arange(count) * self.step
+        left = points.astype(np.int64)
+        frac = (points - left).astype(np.float32)
+        out = smoothed[left] + frac * (smoothed[left + 1] - smoothed[left]) if count else smoothed[:0]
+        
+        # Оставить хвост, начиная с первого отсчета, нужного следующему чанку
+        self.position += count * self.step
+        drop = min(int(self.position), len(x))
+        self.history = x[drop:]
+        self.position -= drop
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16).tobytes()
+
+
+class CaptureBuffer:
+    """Кольцевой буфер записи фиксированного размера с доступом по абсолютным смещениям"""
+    
+    def __init__(self, max_bytes):
+        # Память выделяется сразу и не растет во время записи
+        self.buffer = bytearray(max_bytes)
+        self.capacity = max_bytes
+        self.written = 0
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return min(self.written, self.capacity)
+    
+    @property
+    def overflowed(self):
+        """Самое старое аудио уже перезаписано"""
+        return self.written > self.capacity
+    
+    def write(self, data):
+        """Дописать чанк, при переполнении перезаписав самые старые данные"""
+        with self.lock:
+            size = len(data)
+            if size > self.capacity:
+                self.written += size - self.capacity
+                data = data[-self.capacity:]
+                size = self.capacity
+            pos = self.written % self.capacity
+            first = min(size, self.capacity - pos)
+            self.buffer[pos:pos + first] = data[:first]
+            if first < size:
+                self.buffer[:size - first] = data[first:]
+            self.written += size
+    
+    def view(self, start=None, end=None):
+        """memoryview на данные [start, end) от начала записи: без копирования, если они не переходят через конец кольца"""
+        # Буфер не переставляется на месте: выданные ранее представления остаются верными,
+        # пока новые записи не перезапишут их участок кольца
+        with self.lock:
+            oldest = max(self.written - self.capacity, 0)
+            start = oldest if start is None else max(start, oldest)
+            end = self.written if end is None else min(end, self.written)
+            if end <= start:
+                return memoryview(b'')
+            pos = start % self.capacity
+            if pos + end - start <= self.capacity:
+                return memoryview(self.buffer)[pos:pos + end - start]
+            # Данные переходят через конец кольца: склеить две части в новый буфер
+            return memoryview(self.buffer[pos:] + self.buffer[:end - start - (self.capacity - pos)])
+
+
+class AudioInput:
+    """Постоянно открытый входной поток (режим callback), пишущий в кольцевой буфер"""
+    
+    def __init__(self, audio, sample_rate, max_bytes, device_rate=None, channels=1):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.device_rate = device_rate or sample_rate
+        self.channels = channels
+        # В кольцо пишется уже mono с частотой движка
+        self.resampler = Resampler(self.device_rate, sample_rate, channels)
+        self.ring = CaptureBuffer(max_bytes)
+        self.stream = None
+        self.listener = None
+        self.lock = threading.Lock()
+    
+    def open(self):
+        started = time.perf_counter()
+        self.stream = self.audio.open(
+            format=PA_INT16,
+            channels=self.channels,
+            rate=self.device_rate,
+            input=True,
+            frames_per_buffer=self.device_rate * 64 // 1000,
+            stream_callback=self._callback
+        )
+        metrics.observe('stream_open_seconds', time.perf_counter() - started)
+        log(f"🎙️ Микрофон открыт постоянно, буфер {self.ring.capacity / 2 / self.sample_rate:.0f} с")
+    
+    def _callback(self, in_data, frame_count, time_info, status):
+        data = self.resampler.process(in_data)
+        with self.lock:
+            self.ring.write(data)
+            if self.listener:
+                self.listener(data)
+        return None, PA_CONTINUE
+    
+    def begin(self, preroll_bytes, listener=None):
+        """Начать сессию с захватом preroll_bytes уже записанного аудио; вернуть ее начальное смещение"""
+        with self.lock:
+            start = max(self.ring.written - preroll_bytes, self.ring.written - len(self.ring))
+            if listener:
+                # Предзапись тоже уходит в потоковое распознавание
+                preroll = self.ring.view(start)
+                if preroll:
+                    listener(bytes(preroll))
+                self.listener = listener
+        return start
+    
+    def end(self, start):
+        """Завершить сессию: вернуть ее аудио отдельным буфером (кольцо продолжает перезаписываться)"""
+        with self.lock:
+            self.listener = None
+            end = self.ring.written
+            lost = end - len(self.ring) - start
+            audio_data = self.ring.view(start)
+            capture = None
+            if audio_data:
+                capture = CaptureBuffer(len(audio_data))
+                capture.write(audio_data)
+        if lost > 0:
+            log(f"⚠️ Запись длиннее буфера, потеряно {lost / 2 / self.sample_rate:.1f} с начала")
+        metrics.count('captured_bytes_total', end - start)
+        return capture
+    
+    def close(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+
+class RecognizerPool:
+    """Пул прогретых KaldiRecognizer для каждой модели"""
+    
+    def __init__(self, sample_rate, size=2):
+        self.sample_rate = sample_rate
+        self.size = size
+        self.idle = {}
+        self.retired = weakref.WeakSet()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.constructed = 0
+        self.construct_time = 0.0
+    
+    def _create(self, model):
+        start = time.perf_counter()
+        rec = KaldiRecognizer(model, self.sample_rate)
+        rec.SetWords(True)
+        elapsed = time.perf_counter() - start
+        metrics.observe('recognizer_construct_seconds', elapsed)
+        with self.lock:
+            self.constructed += 1
+            self.construct_time += elapsed
+        return rec
+    
+    def warm(self, model):
+        """Заранее создать распознаватели для модели"""
+        for _ in range(self.size):
+            self.release(model, self._create(model), reset=False)
+    
+    def acquire(self, model):
+        """Взять готовый распознаватель или создать новый"""
+        with self.lock:
+            idle = self.idle.get(model)
+            if idle:
+                self.hits += 1
+                metrics.count('recognizer_pool_total', result='hit')
+                return idle.pop()
+            self.misses += 1
+        metrics.count('recognizer_pool_total', result='miss')
+        return self._create(model)
+    
+    def release(self, model, rec, reset=True):
+        """Вернуть распознаватель в пул, сбросив состояние"""
+        if reset:
+            rec.Reset()
+        with self.lock:
+            if model in self.retired:
+                return
+            idle = self.idle.setdefault(model, [])
+            if len(idle) < self.size:
+                idle.append(rec)
+    
+    def prune(self, model):
+        """Убрать распознаватели выгруженной модели; возвращенные позже тоже не сохраняются"""
+        with self.lock:
+            self.idle.pop(model, None)
+            self.retired.add(model)
+    
+    def stats(self):
+        """Статистика пула: попадания, промахи, среднее время создания"""
+        with self.lock:
+            avg = self.construct_time / self.constructed if self.constructed else 0.0
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'avg_construct_ms': avg * 1000,
+                'saved_s': self.hits * avg
+            }
+
+
+class ModelRegistry:
+    """Загруженные модели Vosk: одна копия на путь, общая для всех пользователей, со счетчиком ссылок"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+    
+    def acquire(self, path):
+        """Получить модель (загрузив при первом обращении) и увеличить счетчик ссылок"""
+        with self.lock:
+            entry = self.entries.get(path)
+            loader = entry is None
+            if loader:
+                entry = self.entries[path] = {'model': None, 'refs': 0, 'ready': threading.Event(), 'error': None}
+            entry['refs'] += 1
+        
+        if loader:
+            try:
+                entry['model'] = Model(path)
+            except Exception as e:
+                entry['error'] = e
+                with self.lock:
+                    del self.entries[path]
+            finally:
+                entry['ready'].set()
+        else:
+            # Ту же модель уже загружает другой поток
+            entry['ready'].wait()
+        if entry['error']:
+            raise entry['error']
+        return entry['model']
+    
+    def release(self, path):
+        """Уменьшить счетчик ссылок; вернуть модель, если она больше никому не нужна"""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            entry['refs'] -= 1
+            if entry['refs'] > 0:
+                return None
+            del self.entries[path]
+            return entry['model']
+    
+    def loaded(self):
+        """Пути загруженных моделей и число ссылок на них"""
+        with self.lock:
+            return {path: entry['refs'] for path, entry in self.entries.items() if entry['model']}
+
+
+model_registry = ModelRegistry()
+
+
+def decode_with_model(model, audio_data, sample_rate, pool=None, chunk_bytes=32000):
+    """Распознать буфер одной моделью: (text, words)"""
+    if pool:
+        rec = pool.acquire(model)
+    else:
+        rec = KaldiRecognizer(model, sample_rate)
+        rec.SetWords(True)
+    
+    # Подавать буфер (в т.ч. memoryview) порциями: копируется только текущий чанк
+    results = []
+    try:
+        for i in range(0, len(audio_data), chunk_bytes):
+            if rec.AcceptWaveform(bytes(audio_data[i:i + chunk_bytes])):
+                results.append(json.loads(rec.Result()))
+        results.append(json.loads(rec.FinalResult()))
+    finally:
+        if pool:
+            pool.release(model, rec)
+    
+    texts = [r.get('text', '').strip() for r in results if r.get('text', '').strip()]
+    words = [w for r in results for w in r.get('result', [])]
+    return ' '.join(texts), words
+
+
+# Модели, загруженные в процессе-воркере (режим parallel: process)
+_worker_model_paths = {}
+_worker_models = {}
+_worker_pools = {}
+
+
+def _init_decode_worker(model_paths):
+    """Инициализатор процесса-воркера: запомнить пути к моделям"""
+    _worker_model_paths.update(model_paths)
+
+
+def _decode_in_worker(lang, audio_data, sample_rate):
+    """Распознавание в процессе-воркере, модель загружается один раз на процесс"""
+    if lang not in _worker_models:
+        _worker_models[lang] = Model(_worker_model_paths[lang])
+    if sample_rate not in _worker_pools:
+        _worker_pools[sample_rate] = RecognizerPool(sample_rate)
+    return decode_with_model(_worker_models[lang], audio_data, sample_rate, _worker_pools[sample_rate])
+
+
+def read_wav(path, sample_rate):
+    """Прочитать 16-bit WAV и привести к mono с нужной частотой"""
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: нужен 16-bit WAV")
+        resampler = Resampler(wf.getframerate(), sample_rate, wf.getnchannels())
+        return resampler.process(wf.readframes(wf.getnframes()))
+
+
+def encode_audio(audio_data, sample_rate, encoding='LINEAR16'):
+    """Упаковать mono int16 для Google: (кодировка, байты); FLAC и OGG_OPUS - через soundfile, если он установлен"""
+    if encoding in ('FLAC', 'OGG_OPUS'):
+        try:
+            import soundfile
+            samples = np.frombuffer(audio_data, dtype=np.int16)
+            out = io.BytesIO()
+            if encoding == 'FLAC':
+                soundfile.write(out, samples, sample_rate, format='FLAC', subtype='PCM_16')
+            else:
+                soundfile.write(out, samples, sample_rate, format='OGG', subtype='OPUS')
+            return encoding, out.getvalue()
+        except Exception as e:
+            log(f"⚠️ Кодировка {encoding} недоступна ({e}), отправка LINEAR16")
+    
+    wav_buffer = io.BytesIO()
+    wf = wave.open(wav_buffer, 'wb')
+    wf.setnchannels(1)
+    wf.setsampwidth(2)
+    wf.setframerate(sample_rate)
+    wf.writeframes(audio_data)
+    wf.close()
+    return 'LINEAR16', wav_buffer.getvalue()
+
+
+# Распознаватель в процессе пакетной обработки
+_batch_transcriber = None
+
+
+def _init_batch_worker(offline):
+    """Инициализатор процесса пакетной обработки: модели загружаются один раз"""
+    global _batch_transcriber
+    # stdout занят результатами JSONL, журнал воркеров уходит в stderr
+    sys.stdout = sys.stderr
+    _batch_transcriber = AudioTranscriber(interactive=False)
+    if offline:
+        _batch_transcriber.config.setdefault('deepseek', {})['enabled'] = False
+
+
+def _transcribe_batch_file(path):
+    try:
+        return _batch_transcriber.transcribe_file(path)
+    finally:
+        # Процесс пула завершается без atexit: сохранить кэш после каждого файла
+        if _batch_transcriber.ai_cache:
+            _batch_transcriber.ai_cache.flush()
+
+
+def collect_wav_files(paths):
+    """WAV-файлы из списка файлов и папок (рекурсивно)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith('.wav'))
+        else:
+            files.append(path)
+    return files
+
+
+def run_batch(args):
+    """Пакетное распознавание WAV-файлов пулом процессов с выводом JSONL"""
+    files = collect_wav_files(args.paths)
+    if not files:
+        print("⚠️ WAV-файлы не найдены", file=sys.stderr)
+        return
+    
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    started = time.perf_counter()
+    total_audio = 0.0
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_batch_worker,
+                                 initargs=(args.offline,)) as executor:
+            futures = [executor.submit(_transcribe_batch_file, path) for path in files]
+            # Результаты пишутся по мере готовности, а не в порядке файлов
+            for future in as_completed(futures):
+                result = future.result()
+                total_audio += result.get('duration_s', 0)
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"✅ Файлов: {len(files)}, аудио {total_audio:.1f} с, обработка {elapsed:.1f} с, "
+          f"RTF {elapsed / total_audio if total_audio else 0:.3f}", file=sys.stderr)
+
+
+class StreamingRecognizer:
+    """Потоковое распознавание одной моделью: чанки подаются по мере записи"""
+    
+    def __init__(self, get_model, pool, label):
+        self.label = label
+        self.get_model = get_model
+        self.model = None
+        self.pool = pool
+        self.recognizer = None
+        self.texts = []
+        self.words = []
+        self.partial = ''
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def feed(self, data):
+        """Передать чанк аудио в очередь распознавания"""
+        self.queue.put(data)
+    
+    def _run(self):
+        """Декодировать чанки в отдельном потоке, не блокируя запись"""
+        # Если модель еще загружается, чанки копятся в очереди
+        self.model = self.get_model(self.label)
+        if self.model:
+            self.recognizer = self.pool.acquire(self.model)
+        
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if not self.recognizer:
+                continue
+            try:
+                if self.recognizer.AcceptWaveform(data):
+                    # Завершенный фрагмент речи (пауза) - сохранить слова
+                    self._add_result(json.loads(self.recognizer.Result()))
+                    self.partial = ''
+                else:
+                    self.partial = json.loads(self.recognizer.PartialResult()).get('partial', '')
+            except Exception as e:
+                log(f"❌ Ошибка потокового распознавания ({self.label}): {e}")
+    
+    def _add_result(self, result):
+        text = result.get('text', '').strip()
+        if text:
+            with self.lock:
+                self.texts.append(text)
+                self.words.extend(result.get('result', []))
+    
+    def busy(self):
+        """Идет речь или в очереди есть необработанные чанки"""
+        return bool(self.partial) or not self.queue.empty()
+    
+    def snapshot(self):
+        """Завершенные фрагменты на текущий момент: (text, words)"""
+        with self.lock:
+            return ' '.join(self.texts), list(self.words)
+    
+    def partial_text(self):
+        """Текущая гипотеза: завершенные фрагменты + промежуточный результат"""
+        parts = self.texts + ([self.partial] if self.partial else [])
+        return ' '.join(parts)
+    
+    def close(self):
+        """Сообщить потоку, что новых чанков не будет"""
+        self.queue.put(None)
+    
+    def result(self):
+        """Дождаться обработки очереди и получить итог (text, words)"""
+        self.thread.join()
+        if self.recognizer:
+            self._add_result(json.loads(self.recognizer.FinalResult()))
+            self.pool.release(self.model, self.recognizer)
+        return ' '.join(self.texts), self.words
+
+
+class StreamingSession:
+    """Сессия потокового распознавания русской и английской моделями"""
+    
+    def __init__(self, langs, get_model, pool):
+        # Каждая модель декодирует в своем потоке
+        self.recognizers = {
+            lang: StreamingRecognizer(get_model, pool, lang)
+            for lang in langs
+        }
+    
+    def feed(self, data):
+        for recognizer in self.recognizers.values():
+            recognizer.feed(data)
+    
+    def partial_results(self):
+        """Промежуточные гипотезы по языкам"""
+        return {lang: r.partial_text() for lang, r in self.recognizers.items()}
+    
+    def stable_results(self):
+        """Гипотезы всех моделей, если речь сейчас не идет, иначе None"""
+        if any(r.busy() for r in self.recognizers.values()):
+            return None
+        return {lang: r.snapshot() for lang, r in self.recognizers.items()}
+    
+    def finish(self):
+        """Завершить распознавание: {язык: (text, words)}"""
+        for recognizer in self.recognizers.values():
+            recognizer.close()
+        return {lang: r.result() for lang, r in self.recognizers.items()}
+
+
+class SpeculativeCombiner:
+    """Заранее запускает комбинирование RU/EN, как только гипотезы обеих моделей стабилизировались"""
+    
+    def __init__(self, session, combine, interval=0.2):
+        self.session = session
+        self.combine = combine
+        self.interval = interval
+        self.key = None
+        self.future = None
+        self.info = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            results = self.session.stable_results()
+            if not results or 'ru' not in results or 'en' not in results:
+                continue
+            # Пока идет вызов, новые гипотезы не ставятся в очередь: после него уйдет только самая свежая
+            if self.future and not self.future.done():
+                continue
+            (text_ru, words_ru), (text_en, words_en) = results['ru'], results['en']
+            key = (text_ru, text_en)
+            if words_ru and words_en and key != self.key:
+                # Пауза в речи: итог, скорее всего, уже не изменится
+                self.key = key
+                # Способ комбинирования и ответ для кэша учитываются, только если результат пригодится
+                self.info = {}
+                self.future = self.executor.submit(self.combine, words_ru, words_en, text_ru, text_en, self.info)
+    
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def result_for(self, text_ru, text_en):
+        """Готовый результат, если итоговые гипотезы совпали с отправленными заранее"""
+        self.stop()
+        if not self.future or self.key != (text_ru, text_en):
+            return None
+        try:
+            return self.future.result()
+        except Exception as e:
+            log(f"⚠️ Ошибка заблаговременного комбинирования: {e}")
+            return None
+
+
+# Названия этапов для вывода в консоль
+STAGE_NAMES = {
+    'queue': 'очередь',
+    'capture': 'запись',
+    'decode': 'декодирование',
+    'combine': 'комбинирование',
+    'recognize': 'распознавание',
+    'paste': 'вставка'
+}
+
+
+class StageTimer:
+    """Задержки этапов обработки одной фразы: от конца записи до вставки"""
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.stages = []
+    
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        metrics.observe('stage_seconds', now - self.last, stage=stage)
+        self.last = now
+    
+    def report(self):
+        metrics.observe('utterance_seconds', self.last - self.start)
+        stages = ', '.join(f"{STAGE_NAMES.get(stage, stage)} {elapsed * 1000:.0f} мс" for stage, elapsed in self.stages)
+        log(f"⏱️ Этапы: {stages} | итого {(self.last - self.start) * 1000:.0f} мс")
+
+
+# Одна фраза: все, что нужно для распознавания и вставки, фиксируется в момент остановки записи
+Job = namedtuple('Job', 'seq capture hwnd session speculator timer recorder started stopped engine rate')
+
+
+class TranscriptionQueue:
+    """Очередь распознавания фраз: задания обрабатывает пул потоков, текст вставляется строго по порядку записи"""
+    
+    def __init__(self, process, deliver, workers=2):
+        self.process = process
+        self.deliver = deliver
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcribe')
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.next_seq = 0
+        self.next_deliver = 0
+        self.finished = {}
+        self.delivering = False
+        self.depth = 0
+    
+    def new_seq(self):
+        """Номер для следующего задания; каждый выданный номер должен быть отправлен в submit"""
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            return seq
+    
+    def submit(self, job):
+        with self.lock:
+            self.depth += 1
+            metrics.gauge('queue_depth', self.depth)
+        self.executor.submit(self._run, job, time.perf_counter())
+    
+    def _run(self, job, queued):
+        metrics.observe('queue_wait_seconds', time.perf_counter() - queued)
+        try:
+            text = self.process(job)
+        except Exception as e:
+            metrics.count('errors_total', stage='job')
+            log(f"❌ Ошибка обработки фразы #{job.seq}: {e}")
+            text = None
+        
+        with self.lock:
+            self.finished[job.seq] = (job, text)
+            # Вставкой занимается один поток за раз: он же подхватит фразы, готовые за время вставки
+            if self.delivering:
+                return
+            self.delivering = True
+        
+        while True:
+            # Более поздняя фраза ждет, пока не будут вставлены все предыдущие
+            with self.lock:
+                ready = []
+                while self.next_deliver in self.finished:
+                    ready.append(self.finished.pop(self.next_deliver))
+                    self.next_deliver += 1
+                if not ready:
+                    self.delivering = False
+                    return
+            
+            # Вставка идет без блокировки, чтобы new_seq и submit не ждали ее в потоке горячих клавиш
+            for ready_job, ready_text in ready:
+                if ready_text:
+                    try:
+                        self.deliver(ready_job, ready_text)
+                    except Exception as e:
+                        log(f"❌ Ошибка вставки фразы #{ready_job.seq}: {e}")
+            
+            with self.lock:
+                self.depth -= len(ready)
+                metrics.gauge('queue_depth', self.depth)
+                self.idle.notify_all()
+    
+    def join(self):
+        """Дождаться обработки и вставки всех отправленных фраз"""
+        with self.lock:
+            while self.depth:
+                self.idle.wait()
+
+
+class AICache:
+    """Кэш ответов DeepSeek на диске: LRU-вытеснение и время жизни записей"""
+    
+    def __init__(self, path, max_entries=1000, ttl_s=30 * 24 * 3600, save_delay=2.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.save_delay = save_delay
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.saved_s = 0.0
+        self.entries.update(self._read())
+        # Запись на диск - в фоне и не чаще раза в save_delay, а не на каждый ответ DeepSeek
+        threading.Thread(target=self._run, daemon=True).start()
+        atexit.register(self.flush)
+    
+    @staticmethod
+    def key(text_ru, text_en):
+        """Ключ по нормализованной паре гипотез"""
+        normalize = lambda text: ' '.join(text.lower().split())
+        return f"{normalize(text_ru)}\t{normalize(text_en)}"
+    
+    def _read(self):
+        """Записи из файла, от самых старых к самым свежим"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return OrderedDict((key, entry) for key, entry in json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log(f"⚠️ Не удалось прочитать кэш DeepSeek: {e}")
+        return OrderedDict()
+    
+    def _run(self):
+        while True:
+            self.dirty.wait()
+            time.sleep(self.save_delay)
+            self.flush()
+    
+    def flush(self):
+        """Записать кэш на диск, если в нем есть несохраненные ответы"""
+        with self.save_lock:
+            if not self.dirty.is_set():
+                return
+            self.dirty.clear()
+            with self.lock:
+                snapshot = list(self.entries.items())
+            try:
+                # Другие процессы (batch --workers) пишут тот же файл: дополнить их записи своими
+                merged = self._read()
+                for key, entry in snapshot:
+                    merged.pop(key, None)
+                    merged[key] = entry
+                items = list(merged.items())[-self.max_entries:]
+                directory = os.path.dirname(self.path) or '.'
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.deepseek-', suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump(items, f, ensure_ascii=False)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+            except Exception as e:
+                log(f"⚠️ Не удалось сохранить кэш DeepSeek: {e}")
+    
+    def get(self, key):
+        """Вернуть сохраненный текст или None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry['time'] > self.ttl_s:
+                del self.entries[key]
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.saved_s += entry.get('latency', 0.0)
+            return entry['text']
+    
+    def peek(self, key):
+        """Сохраненный текст или None, без учета в статистике и без обновления порядка LRU"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry['time'] <= self.ttl_s:
+                return entry['text']
+            return None
+    
+    def put(self, key, text, latency):
+        """Сохранить ответ и время, которое он занял"""
+        with self.lock:
+            self.entries[key] = {'text': text, 'time': time.time(), 'latency': latency}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.dirty.set()
+    
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class Glossary:
+    """Локальная замена русской транслитерации на английские IT-термины"""
+    
+    def __init__(self, terms):
+        # Индекс по первому слову варианта, длинные варианты проверяются первыми
+        self.index = {}
+        for term, variants in terms.items():
+            for variant in variants:
+                tokens = tuple(variant.lower().split())
+                if tokens:
+                    self.index.setdefault(tokens[0], []).append((tokens, term))
+        for candidates in self.index.values():
+            candidates.sort(key=lambda candidate: len(candidate[0]), reverse=True)
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(yaml.safe_load(f) or {})
+    
+    def find(self, tokens):
+        """Найти транслитерации в словах: [(позиция, длина, термин)]"""
+        matches = []
+        i = 0
+        while i < len(tokens):
+            for variant, term in self.index.get(tokens[i], ()):
+                if tuple(tokens[i:i + len(variant)]) == variant:
+                    matches.append((i, len(variant), term))
+                    i += len(variant)
+                    break
+            else:
+                i += 1
+        return matches
+    
+    def combine(self, words_ru, words_en, min_confidence=None, en_max_confidence=0.8, ai_available=True):
+        """Итоговый текст, если решение очевидно без AI, иначе None"""
+        tokens_ru = [w.get('word', '').lower() for w in words_ru]
+        matches = self.find(tokens_ru)
+        
+        if not matches:
+            # Термина нет в глоссарии - это не значит, что в фразе нет транслитерации: решает AI.
+            # Только если явно задан min_confidence, уверенная русская фраза берется целиком
+            if min_confidence is None:
+                return None
+            confidence = sum(w.get('conf', 0) for w in words_ru) / max(len(words_ru), 1)
+            return ' '.join(tokens_ru) if confidence >= min_confidence else None
+        
+        # Термин должен подтверждаться английской гипотезой ("snap mirror" -> "snapmirror")
+        tokens_en = [w.get('word', '').lower() for w in words_en]
+        used = set()
+        for _, _, term in matches:
+            form = term.lower().replace(' ', '')
+            span = next((
+                range(i, i + n)
+                for n in (1, 2, 3)
+                for i in range(len(tokens_en) - n + 1)
+                if ''.join(tokens_en[i:i + n]) == form and not used.intersection(range(i, i + n))
+            ), None)
+            if span is None:
+                return None
+            used.update(span)
+        
+        # Уверенное английское слово вне найденных терминов - возможно, еще один термин не из глоссария:
+        # решает AI. Без AI лучше заменить известные термины, чем совмещать по времени
+        leftover = [w for i, w in enumerate(words_en) if i not in used]
+        if ai_available and any(w.get('conf', 0) >= en_max_confidence for w in leftover):
+            return None
+        
+        result = []
+        position = 0
+        for start, length, term in matches:
+            result.extend(tokens_ru[position:start])
+            result.append(term)
+            position = start + length
+        result.extend(tokens_ru[position:])
+        return ' '.join(result)
+
+
+# Время установки соединений (DNS + TCP + TLS) в текущем потоке
+_http_timing = threading.local()
+
+
+class _TimedConnectionMixin:
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _http_timing.connect_s = getattr(_http_timing, 'connect_s', 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Адаптер requests, замеряющий время установки соединения"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class HttpClient:
+    """Общий HTTP-клиент с пулом keep-alive соединений для DeepSeek и Google"""
+    
+    def __init__(self, http_config):
+        self.timeout = (
+            http_config.get('connect_timeout', 3),
+            http_config.get('read_timeout', 10)
+        )
+        # POST повторяется, только если сервер его точно не обработал: ошибка соединения или 429/503.
+        # После таймаута чтения повтора нет, иначе ожидание DeepSeek выросло бы вдвое
+        retry = Retry(
+            total=http_config.get('retries', 1),
+            read=0,
+            backoff_factor=http_config.get('backoff', 0.3),
+            status_forcelist=(429, 503),
+            allowed_methods=None,
+            raise_on_status=False
+        )
+        pool_size = http_config.get('pool_size', 4)
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Тело-генератор нельзя отправить повторно: потоковые запросы идут через сессию без повторов
+        once = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.once_session = requests.Session()
+        self.once_session.mount('http://', once)
+        self.once_session.mount('https://', once)
+        self.last_timing = None
+    
+    def post(self, name, url, retry=True, **kwargs):
+        """POST с замером: соединение отдельно от ответа сервера"""
+        kwargs.setdefault('timeout', self.timeout)
+        _http_timing.connect_s = 0.0
+        start = time.perf_counter()
+        session = self.session if retry else self.once_session
+        response = session.post(url, **kwargs)
+        total = time.perf_counter() - start
+        connect = _http_timing.connect_s
+        self.last_timing = {'name': name, 'connect_s': connect, 'server_s': total - connect, 'total_s': total}
+        metrics.count('http_requests_total', api=name, status=response.status_code)
+        metrics.observe('http_connect_seconds', connect, api=name)
+        metrics.observe('http_server_seconds', total - connect, api=name)
+        log(f"  🌐 {name}: HTTP {response.status_code}, соединение {connect * 1000:.0f} мс, "
+            f"ответ {(total - connect) * 1000:.0f} мс")
+        return response
+    
+    def preconnect(self, url, retry=True):
+        """Открыть соединение заранее в фоне, чтобы запрос не платил за DNS/TCP/TLS"""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}/"
+        # Прогревается пул той сессии, через которую пойдет запрос (см. post)
+        session = self.session if retry else self.once_session
+        
+        def connect():
+            try:
+                session.head(origin, timeout=self.timeout)
+            except Exception as e:
+                log(f"⚠️ Не удалось заранее подключиться к {parts.netloc}: {e}")
+        
+        threading.Thread(target=connect, daemon=True).start()
+
+
+class ChunkedUpload:
+    """Запрос в Google speech:recognize, тело которого уходит чанками (Transfer-Encoding: chunked) во время записи"""
+    
+    def __init__(self, http, url, params, request_config, timeout, max_bytes=None):
+        self.queue = queue.Queue()
+        self.pending = b''
+        self.max_bytes = max_bytes
+        self.overflow = False
+        self.audio_bytes = 0
+        self.sent_bytes = 0
+        self.stopped = None
+        self.body_done = None
+        self.received = None
+        self.response = None
+        self.error = None
+        # base64 аудио дописывается прямо внутрь JSON между prefix и suffix
+        self.prefix = ('{"config": ' + json.dumps(request_config) + ', "audio": {"content": "').encode('utf-8')
+        self.suffix = b'"}}'
+        self.thread = threading.Thread(
+            target=self._run, args=(http, url, params, timeout), daemon=True
+        )
+        self.thread.start()
+    
+    def _run(self, http, url, params, timeout):
+        try:
+            self.response = http.post(
+                'Google', url, retry=False, params=params, data=self._body(),
+                headers={'Content-Type': 'application/json'}, timeout=timeout
+            )
+        except Exception as e:
+            self.error = e
+        self.received = time.perf_counter()
+    
+    def _body(self):
+        yield self._sent(self.prefix)
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            self.pending += data
+            # base64 кодирует группы по 3 байта: остаток ждет следующего чанка
+            cut = len(self.pending) - len(self.pending) % 3
+            if cut:
+                chunk, self.pending = self.pending[:cut], self.pending[cut:]
+                yield self._sent(base64.b64encode(chunk))
+        if self.pending:
+            yield self._sent(base64.b64encode(self.pending))
+        yield self._sent(self.suffix)
+        self.body_done = time.perf_counter()
+    
+    def _sent(self, chunk):
+        self.sent_bytes += len(chunk)
+        return chunk
+    
+    def feed(self, data):
+        if self.overflow:
+            return
+        if self.max_bytes and self.audio_bytes + len(data) > self.max_bytes:
+            # Google не примет такой длинный запрос: закрыть тело, запись уйдет частями после остановки
+            self.overflow = True
+            self.queue.put(None)
+            return
+        self.audio_bytes += len(data)
+        self.queue.put(bytes(data))
+    
+    def partial_results(self):
+        return {}
+    
+    def finish(self):
+        """Закрыть тело запроса и дождаться ответа (None при ошибке соединения или слишком длинной записи)"""
+        self.stopped = time.perf_counter()
+        self.queue.put(None)
+        self.thread.join()
+        if self.overflow:
+            self.error = 'запись длиннее лимита одного запроса'
+            return None
+        return self.response
+
+
+# Звуковые сигналы: (частота Гц, длительность мс). Двойной beep для надежности
+START_TONES = ((1200, 100), (1400, 100))
+STOP_TONES = ((1000, 100), (800, 150))
+
+
+class WinsoundFeedback:
+    """Сигналы через winsound.Beep (только Windows)"""
+    
     def __init__(self):
+        import winsound
+        self.winsound = winsound
+    
+    def play(self, tones):
+        for frequency, duration in tones:
+            self.winsound.Beep(frequency, duration)
+
+
+class BellFeedback:
+    """Терминальный звонок: работает на любой платформе"""
+    
+    def play(self, tones):
+        sys.stderr.write('\a')
+        sys.stderr.flush()
+
+
+class SilentFeedback:
+    """Без звука"""
+    
+    def play(self, tones):
+        pass
+
+
+FEEDBACK_BACKENDS = {
+    'winsound': WinsoundFeedback,
+    'bell': BellFeedback,
+    'none': SilentFeedback,
+}
+
+
+class Notifier:
+    """Асинхронные звуковые сигналы: проигрываются в своем потоке и не задерживают запись"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    @classmethod
+    def from_config(cls, feedback_config):
+        """Создать по секции feedback; auto - winsound, если доступен, иначе терминальный звонок"""
+        name = feedback_config.get('backend', 'auto')
+        if name == 'auto':
+            try:
+                return cls(WinsoundFeedback())
+            except ImportError:
+                return cls(BellFeedback())
+        try:
+            return cls(FEEDBACK_BACKENDS[name]())
+        except Exception as e:
+            log(f"⚠️ Звуковые сигналы '{name}' недоступны: {e}")
+            return cls(SilentFeedback())
+    
+    def notify(self, tones):
+        """Поставить сигнал в очередь и сразу вернуться"""
+        self.queue.put(tones)
+    
+    def _run(self):
+        while True:
+            tones = self.queue.get()
+            try:
+                self.backend.play(tones)
+            except Exception as e:
+                log(f"⚠️ Не удалось проиграть звук: {e}")
+
+
+def wait_until(predicate, timeout, interval=0.005):
+    """Опрашивать predicate, пока он не станет истинным или не выйдет время"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        if predicate():
+            return True
+        if time.perf_counter() >= deadline:
+            return False
+        time.sleep(interval)
+
+
+class Win32Windows:
+    """Окна Windows через user32"""
+    
+    def foreground(self):
+        import ctypes
+        return ctypes.windll.user32.GetForegroundWindow()
+    
+    def activate(self, hwnd):
+        import ctypes
+        ctypes.windll.user32.BringWindowToTop(hwnd)
+        return ctypes.windll.user32.SetForegroundWindow(hwnd) != 0
+    
+    def switch_previous(self):
+        import pyautogui
+        pyautogui.hotkey('alt', 'tab')
+
+
+class SystemClipboard:
+    """Системный буфер обмена через pyperclip"""
+    
+    def get(self):
+        return pyperclip.paste()
+    
+    def set(self, text):
+        pyperclip.copy(text)
+
+
+class SystemKeyboard:
+    """Нажатия клавиш: Ctrl+V через pyautogui, ввод Unicode-текста через keyboard"""
+    
+    def paste(self):
+        import pyautogui
+        pyautogui.hotkey('ctrl', 'v')
+    
+    def type(self, text):
+        import keyboard
+        keyboard.write(text)
+    
+    def modifiers_pressed(self):
+        """Зажат ли модификатор (например, Alt от горячей клавиши Alt+`)"""
+        import keyboard
+        return any(keyboard.is_pressed(key) for key in ('alt', 'ctrl', 'shift', 'windows'))
+
+
+class TextInserter:
+    """Вставка текста в окно: готовность фокуса и буфера обмена проверяется опросом, а не паузами"""
+    
+    def __init__(self, windows, clipboard, keys, insert_config):
+        self.windows = windows
+        self.clipboard = clipboard
+        self.keys = keys
+        self.backend = insert_config.get('backend', 'auto')
+        self.typing_max_chars = insert_config.get('typing_max_chars', 40)
+        self.focus_timeout = insert_config.get('focus_timeout_ms', 300) / 1000
+        self.clipboard_timeout = insert_config.get('clipboard_timeout_ms', 200) / 1000
+        self.restore_delay = insert_config.get('restore_delay_ms', 50) / 1000
+        self.release_timeout = insert_config.get('release_timeout_ms', 500) / 1000
+    
+    def wait_release(self):
+        """Дождаться отпускания модификаторов: иначе набор станет Alt+буквой, а вставка - Ctrl+Alt+V"""
+        try:
+            if not wait_until(lambda: not self.keys.modifiers_pressed(), self.release_timeout):
+                log("⚠️ Модификаторы все еще зажаты, вставка без ожидания")
+        except Exception as e:
+            log(f"⚠️ Не удалось проверить модификаторы: {e}")
+    
+    def focus(self, hwnd):
+        """Вернуть фокус окну hwnd и дождаться, что оно действительно активно"""
+        if hwnd:
+            try:
+                if self.windows.foreground() == hwnd:
+                    return True
+                log(f"🔄 Восстановление фокуса на окно: {hwnd}")
+                self.windows.activate(hwnd)
+                if wait_until(lambda: self.windows.foreground() == hwnd, self.focus_timeout):
+                    log("✅ Фокус восстановлен")
+                    return True
+                log("⚠️ Окно не получило фокус, используем Alt+Tab")
+            except Exception as e:
+                log(f"⚠️ Ошибка восстановления фокуса: {e}")
+        else:
+            log("🔄 Переключение на предыдущее окно через Alt+Tab")
+        
+        try:
+            before = self.windows.foreground()
+        except Exception:
+            before = None
+        self.windows.switch_previous()
+        # После Alt+Tab ждать смены активного окна
+        try:
+            return wait_until(
+                lambda: self.windows.foreground() == hwnd if hwnd else self.windows.foreground() != before,
+                self.focus_timeout
+            )
+        except Exception:
+            return False
+    
+    def insert(self, text, hwnd):
+        """Вставить текст в окно hwnd (None - предыдущее окно)"""
+        use_typing = self.backend == 'typing' or (
+            self.backend == 'auto' and len(text) <= self.typing_max_chars
+        )
+        if use_typing:
+            # Короткий текст набирается напрямую, без буфера обмена
+            with metrics.timer('insert_seconds', backend='typing'):
+                self.wait_release()
+                self.focus(hwnd)
+                self.keys.type(text)
+            log("✅ Текст набран")
+            return
+        
+        with metrics.timer('insert_seconds', backend='clipboard'):
+            # Сохранить текущее содержимое буфера обмена
+            try:
+                old_clipboard = self.clipboard.get()
+            except Exception:
+                old_clipboard = None
+            
+            # Копировать в буфер обмена и дождаться, что он действительно обновился
+            self.clipboard.set(text)
+            if not wait_until(lambda: self.clipboard.get() == text, self.clipboard_timeout):
+                log("⚠️ Буфер обмена не обновился вовремя")
+            
+            self.wait_release()
+            self.focus(hwnd)
+            self.keys.paste()
+            log("✅ Текст вставлен")
+            
+            # Окно читает буфер асинхронно и об этом не сообщает: короткая пауза перед восстановлением
+            if old_clipboard is not None:
+                time.sleep(self.restore_delay)
+                try:
+                    self.clipboard.set(old_clipboard)
+                    log("♻️ Буфер обмена восстановлен")
+                except Exception:
+                    pass
+
+
+class ConfigWatcher:
+    """Следит за изменением файла конфигурации (по mtime) и вызывает on_change"""
+    
+    def __init__(self, path, on_change, interval=1.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.mtime = self._mtime()
+        self.stopped = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            mtime = self._mtime()
+            if mtime is None or mtime == self.mtime:
+                continue
+            self.mtime = mtime
+            try:
+                self.on_change()
+            except Exception as e:
+                log(f"⚠️ Ошибка применения конфигурации: {e}")
+    
+    def stop(self):
+        self.stopped.set()
+
+
+class AudioTranscriber:
+    def __init__(self, interactive=True, audio=None, config_path='config.yaml'):
         self.is_recording = False
-        self.audio = pyaudio.PyAudio()
-        self.frames = []
-        self.stream = None
+        self.interactive = interactive
+        self.config_path = config_path
+        # Пакетному режиму микрофон не нужен; вместо PyAudio можно передать заменитель
+        self.audio = audio
+        if interactive and audio is None:
+            import pyaudio
+            self.audio = pyaudio.PyAudio()
+        self.capture = None
+        self.stop_event = None
+        self.input = None
+        self.session_start = 0
+        self.session_started = 0
+        self.record_thread = None
         self.saved_hwnd = None
+        self.streaming = None
+        self.speculator = None
+        self.stage_timer = None
+        self._decode_executors = {}
+        self.ai_cache = None
+        self.glossary = None
+        self.inserter = None
+        self.notifier = None
+        self.jobs = None
+        self.recognizer_pool = None
+        self.watcher = None
+        self.recording_engine = None
+        self.recording_rate = None
         
         # Загрузить конфигурацию
         self.load_config()
+        configure_metrics(self.config.get('metrics', {}))
+        if not interactive:
+            # Пакетный режим работает только с Vosk
+            self.config['engine'] = 'vosk'
         
         # Инициализировать Vosk если выбран
         if self.config['engine'] == 'vosk':
             self.init_vosk()
+        
+        self.http = HttpClient(self.config.get('http', {}))
+        self.notifier = Notifier.from_config(self.config.get('feedback', {}) if interactive else {'backend': 'none'})
+        if interactive:
+            self.jobs = TranscriptionQueue(
+                self.transcribe_audio, self.deliver_text,
+                self.config.get('pipeline', {}).get('workers', 2)
+            )
+            self.inserter = TextInserter(Win32Windows(), SystemClipboard(), SystemKeyboard(), self.config.get('insert', {}))
+        
+        cache_config = self.config.get('deepseek', {}).get('cache', {})
+        if cache_config.get('enabled', True):
+            self.ai_cache = AICache(
+                cache_config.get('path', '.cache/deepseek.json'),
+                cache_config.get('max_entries', 1000),
+                cache_config.get('ttl_hours', 720) * 3600
+            )
+        
+        self.load_glossary()
+        
+        audio_config = self.config.get('audio', {})
+        if interactive and audio_config.get('persistent', False):
+            self.open_input()
+        
+        reload_config = self.config.get('reload', {})
+        if interactive and reload_config.get('enabled', True):
+            self.watcher = ConfigWatcher(self.config_path, self.reload_config, reload_config.get('interval_s', 1.0))
+    
+    def load_glossary(self):
+        self.glossary = None
+        glossary_config = self.config.get('glossary', {})
+        if glossary_config.get('enabled', True):
+            try:
+                self.glossary = Glossary.load(glossary_config.get('path', 'glossary.yaml'))
+            except Exception as e:
+                log(f"⚠️ Не удалось загрузить глоссарий: {e}")
+    
+    def engine_rate(self):
+        """Частота, с которой работает выбранный движок распознавания"""
+        if self.config['engine'] == 'vosk':
+            return self.config['vosk']['sample_rate']
+        return self.config.get('google', {}).get('sample_rate', 16000)
+    
+    def capture_format(self, sample_rate):
+        """Формат захвата (частота, каналы): родной формат устройства или сразу формат движка"""
+        if not self.config.get('audio', {}).get('native_format', True):
+            return sample_rate, 1
+        try:
+            info = self.audio.get_default_input_device_info()
+            return int(info['defaultSampleRate']), max(1, min(int(info['maxInputChannels']), 2))
+        except Exception as e:
+            log(f"⚠️ Не удалось определить формат микрофона, запись в {sample_rate} Гц mono: {e}")
+            return sample_rate, 1
+    
+    def open_input(self):
+        """Открыть постоянный входной поток: запись начинается без задержки на открытие устройства"""
+        audio_config = self.config.get('audio', {})
+        sample_rate = self.engine_rate()
+        device_rate, channels = self.capture_format(sample_rate)
+        # Кольцо вмещает самую длинную запись вместе с предзаписью
+        seconds = audio_config.get('max_duration_s', 300) + audio_config.get('preroll_ms', 300) / 1000
+        try:
+            self.input = AudioInput(self.audio, sample_rate, int(seconds * sample_rate) * 2, device_rate, channels)
+            self.input.open()
+        except Exception as e:
+            metrics.count('errors_total', stage='capture')
+            log(f"⚠️ Не удалось открыть постоянный поток, микрофон будет открываться на каждую запись: {e}")
+            self.input = None
+    
+    def close_input(self):
+        """Закрыть постоянный входной поток"""
+        if self.input:
+            self.input.close()
+            self.input = None
     
     def load_config(self):
         """Загрузить конфигурацию из config.yaml"""
         try:
-            with open('config.yaml', 'r', encoding='utf-8') as f:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
                 self.config = yaml.safe_load(f)
-            print(f"⚙️ Движок распознавания: {self.config['engine'].upper()}")
+            log(f"⚙️ Движок распознавания: {self.config['engine'].upper()}")
         except Exception as e:
-            print(f"⚠️ Ошибка загрузки config.yaml: {e}")
+            log(f"⚠️ Ошибка загрузки {self.config_path}: {e}")
             # Дефолтная конфигурация
             self.config = {
                 'engine': 'vosk',
@@ -53,33 +1798,156 @@ class AudioTranscriber:
                 }
             }
     
+    def reload_config(self):
+        """Перечитать config.yaml и применить изменения без перезапуска"""
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = yaml.safe_load(f)
+            engine = config['engine']
+        except Exception as e:
+            # Файл мог быть сохранен не до конца: работать дальше со старой конфигурацией
+            log(f"⚠️ Конфигурация не применена, ошибка в {self.config_path}: {e}")
+            return
+        
+        old, self.config = self.config, config
+        changed = lambda section: old.get(section) != config.get(section)
+        log(f"🔁 Конфигурация перечитана, движок: {engine.upper()}")
+        
+        if engine == 'vosk' and self.recognizer_pool is None:
+            self.init_vosk()
+        elif self.recognizer_pool is not None and changed('vosk'):
+            if config['vosk']['sample_rate'] != self.recognizer_pool.sample_rate:
+                log("⚠️ Новая vosk.sample_rate вступит в силу после перезапуска")
+                config['vosk']['sample_rate'] = self.recognizer_pool.sample_rate
+            for lang, path in self.model_paths().items():
+                if path == self.model_targets.get(lang):
+                    continue
+                if path == self.loaded_paths.get(lang):
+                    # Вернулись к уже загруженной модели: загружающаяся окажется устаревшей и будет отпущена
+                    log(f"↩️ Модель {lang} остается '{path}'")
+                    self.model_targets[lang] = path
+                else:
+                    self.swap_model(lang, path)
+        
+        if self.input and self.engine_rate() != self.input.sample_rate and not self.is_recording:
+            self.close_input()
+            self.open_input()
+        if changed('http'):
+            self.http = HttpClient(config.get('http', {}))
+        if changed('insert') and self.inserter:
+            inserter = self.inserter
+            self.inserter = TextInserter(inserter.windows, inserter.clipboard, inserter.keys, config.get('insert', {}))
+        if changed('feedback') and self.interactive:
+            self.notifier = Notifier.from_config(config.get('feedback', {}))
+        if changed('glossary'):
+            self.load_glossary()
+        
+        restart = [section for section in ('metrics', 'audio', 'pipeline', 'reload') if changed(section)]
+        if restart:
+            log(f"ℹ️ Часть настроек ({', '.join(restart)}) применится к новым записям или после перезапуска")
+    
+    def model_paths(self):
+        return {
+            'ru': self.config['vosk']['model_path'],
+            'en': self.config['vosk'].get('model_path_en', 'model/model-en')
+        }
+    
     def init_vosk(self):
-        """Инициализировать модели Vosk (русская и английская)"""
+        """Инициализировать модели Vosk (русская и английская) в фоновых потоках"""
         self.vosk_model_ru = None
         self.vosk_model_en = None
+        self.recognizer_pool = RecognizerPool(
+            self.config['vosk']['sample_rate'],
+            self.config['vosk'].get('pool_size', 2)
+        )
         
-        try:
-            # Загрузить русскую модель
-            model_path_ru = self.config['vosk']['model_path']
-            if os.path.exists(model_path_ru):
-                print(f"📦 Загрузка русской модели из '{model_path_ru}'...")
-                self.vosk_model_ru = Model(model_path_ru)
-                print("✅ Русская модель загружена")
+        model_paths = self.model_paths()
+        # Состояние готовности: loading / ready / missing / error
+        self.model_status = {lang: 'loading' for lang in model_paths}
+        self.model_events = {lang: threading.Event() for lang in model_paths}
+        # Какая модель используется сейчас и какая должна использоваться (может еще загружаться)
+        self.model_lock = threading.Lock()
+        self.loaded_paths = {}
+        self.model_targets = dict(model_paths)
+        
+        background = self.interactive and self.config['vosk'].get('background_load', True)
+        for lang, path in model_paths.items():
+            if background:
+                threading.Thread(target=self._load_model, args=(lang, path), daemon=True).start()
             else:
-                print(f"❌ Русская модель не найдена в '{model_path_ru}'")
-            
-            # Загрузить английскую модель
-            model_path_en = self.config['vosk'].get('model_path_en', 'model/model-en')
-            if os.path.exists(model_path_en):
-                print(f"📦 Загрузка английской модели из '{model_path_en}'...")
-                self.vosk_model_en = Model(model_path_en)
-                print("✅ Английская модель загружена")
+                self._load_model(lang, path)
+    
+    def swap_model(self, lang, path):
+        """Сменить модель в фоне; до окончания загрузки фразы распознаются текущей"""
+        log(f"🔄 Смена модели {lang} на '{path}', пока работает текущая")
+        self.model_targets[lang] = path
+        threading.Thread(target=self._load_model, args=(lang, path), daemon=True).start()
+    
+    def _load_model(self, lang, path):
+        """Загрузить одну модель, прогреть для нее распознаватели и сделать текущей"""
+        name = 'русской' if lang == 'ru' else 'английской'
+        swapping = lang in self.loaded_paths
+        try:
+            if os.path.exists(path):
+                log(f"📦 Загрузка {name} модели из '{path}'...")
+                start = time.perf_counter()
+                model = model_registry.acquire(path)
+                self.recognizer_pool.warm(model)
+                with self.model_lock:
+                    if self.model_targets[lang] != path:
+                        # Пока модель грузилась, конфигурация успела смениться еще раз
+                        old_path = path
+                    else:
+                        old_path = self.loaded_paths.get(lang)
+                        self.loaded_paths[lang] = path
+                        setattr(self, f'vosk_model_{lang}', model)
+                        self.model_status[lang] = 'ready'
+                elapsed = time.perf_counter() - start
+                metrics.observe('model_load_seconds', elapsed, lang=lang)
+                log(f"✅ Модель {lang} загружена за {elapsed:.1f} с")
+                # Ссылку отпускаем и при повторной загрузке той же модели: реестр выдал ее второй раз
+                if old_path:
+                    self._release_model(old_path)
             else:
-                print(f"⚠️ Английская модель не найдена в '{model_path_en}'")
-                print("   Запустите download_model.cmd для скачивания")
-                
+                log(f"❌ Модель {lang} не найдена в '{path}'")
+                if not swapping:
+                    self.model_status[lang] = 'missing'
+                    if lang == 'en':
+                        log("   Запустите download_model.cmd для скачивания")
         except Exception as e:
-            print(f"❌ Ошибка инициализации Vosk: {e}")
+            if not swapping:
+                self.model_status[lang] = 'error'
+            log(f"❌ Ошибка загрузки модели {lang}: {e}")
+        finally:
+            self.model_events[lang].set()
+            if swapping:
+                # Процесс параллельного декодирования держит старую модель: пересоздать при следующем вызове
+                executor = self._decode_executors.pop(('process', lang), None)
+                if executor:
+                    executor.shutdown(wait=False)
+    
+    def _release_model(self, path):
+        """Отпустить модель; если она больше не используется, убрать ее распознаватели из пула"""
+        model = model_registry.release(path)
+        if model is not None:
+            self.recognizer_pool.prune(model)
+            log(f"🗑️ Модель '{path}' выгружена")
+    
+    def get_model(self, lang, timeout=None):
+        """Получить модель, дождавшись окончания ее загрузки"""
+        self.model_events[lang].wait(timeout)
+        return getattr(self, f'vosk_model_{lang}')
+    
+    def models_loading(self):
+        """Языки, модели которых еще загружаются"""
+        return [lang for lang, status in self.model_status.items() if status == 'loading']
+    
+    def wait_for_models(self):
+        """Дождаться окончания загрузки всех моделей"""
+        if self.models_loading():
+            log("⏳ Ожидание загрузки моделей...")
+        for event in self.model_events.values():
+            event.wait()
     
     def start_listening(self):
         """Начать запись и транскрибацию"""
@@ -88,189 +1956,472 @@ class AudioTranscriber:
         
         # Проверить доступность движка
         if self.config['engine'] == 'vosk':
-            if not self.vosk_model_ru and not self.vosk_model_en:
-                print("❌ Ни одна модель Vosk не загружена")
+            if self.models_loading():
+                # Запись начинается сразу, распознавание дождется загрузки
+                log(f"⏳ Модели еще загружаются ({', '.join(self.models_loading())}), аудио буферизуется")
+            elif not self.vosk_model_ru and not self.vosk_model_en:
+                log("❌ Ни одна модель Vosk не загружена")
                 return
-            if not self.vosk_model_ru:
-                print("⚠️ Русская модель не загружена, используется только английская")
-            if not self.vosk_model_en:
-                print("⚠️ Английская модель не загружена, используется только русская")
+            elif not self.vosk_model_ru:
+                log("⚠️ Русская модель не загружена, используется только английская")
+            elif not self.vosk_model_en:
+                log("⚠️ Английская модель не загружена, используется только русская")
         
         # Сохранить текущее окно с фокусом
         try:
-            import ctypes
-            self.saved_hwnd = ctypes.windll.user32.GetForegroundWindow()
-            print(f"💾 Сохранен фокус окна: {self.saved_hwnd}")
+            self.saved_hwnd = self.inserter.windows.foreground()
+            log(f"💾 Сохранен фокус окна: {self.saved_hwnd}")
         except Exception as e:
-            print(f"⚠️ Не удалось сохранить фокус: {e}")
+            log(f"⚠️ Не удалось сохранить фокус: {e}")
             self.saved_hwnd = None
         
+        sample_rate = self.input.sample_rate if self.input else self.engine_rate()
+        max_duration = self.config.get('audio', {}).get('max_duration_s', 300)
+        # Конфигурация может смениться во время записи: фраза доделывается тем движком, которым начата
+        self.recording_engine = self.config['engine']
+        self.recording_rate = sample_rate
+        
+        # Пока идет запись, заранее открыть соединение с API
+        if self.config.get('http', {}).get('preconnect', True):
+            if self.config['engine'] == 'google':
+                self.http.preconnect(self.google_url(), self.config['google'].get('upload', 'single') != 'stream')
+            elif os.getenv('DEEPSEEK_API_KEY') and self.config.get('deepseek', {}).get('enabled', True):
+                self.http.preconnect(self.deepseek_url())
+        
         self.is_recording = True
-        self.frames = []
+        if not self.input:
+            self.capture = CaptureBuffer(int(max_duration * sample_rate) * 2)
         
-        # Проиграть звук "ding" при старте (синхронно)
-        self._play_start_sound()
+        # Потоковая отправка в Google: тело запроса уходит, пока пользователь говорит
+        google_config = self.config.get('google', {})
+        if self.config['engine'] == 'google' and google_config.get('upload', 'single') == 'stream':
+            api_key = os.getenv('GOOGLE_API_KEY')
+            if api_key:
+                # Длина записи заранее неизвестна: ожидание ответа - как для самого длинного допустимого запроса
+                max_request_s = google_config.get('max_request_s', 55)
+                timeout = (
+                    self.http.timeout[0],
+                    self.http.timeout[1] + max_request_s / 60 * google_config.get('timeout_per_minute_s', 30)
+                )
+                self.streaming = ChunkedUpload(
+                    self.http, self.google_url(), {'key': api_key},
+                    self.google_request_config('LINEAR16', sample_rate), timeout,
+                    int(max_request_s * sample_rate) * 2
+                )
         
-        print("🎤 Запись началась... Говорите! (Нажмите Alt+` или Win+` для остановки)")
+        # Потоковое распознавание: декодировать во время записи
+        if self.config['engine'] == 'vosk' and self.config['vosk'].get('streaming', True):
+            langs = [lang for lang, status in self.model_status.items() if status in ('loading', 'ready')]
+            self.streaming = StreamingSession(langs, self.get_model, self.recognizer_pool)
+            pipeline_config = self.config.get('pipeline', {})
+            if pipeline_config.get('speculative', True):
+                self.speculator = SpeculativeCombiner(
+                    self.streaming, self.combine_results,
+                    pipeline_config.get('stable_ms', 200) / 1000
+                )
+        
+        log("🎤 Запись началась... Говорите! (Нажмите Alt+` или Win+` для остановки)")
+        
+        if self.input:
+            # Поток уже открыт: сессия только отмечает смещение, захватывая предзапись
+            preroll_ms = self.config.get('audio', {}).get('preroll_ms', 300)
+            self.session_start = self.input.begin(
+                int(preroll_ms * sample_rate / 1000) * 2,
+                self.streaming.feed if self.streaming else None
+            )
+            self.session_started = time.perf_counter()
+            self._play_start_sound()
+            return
+        
+        self.session_started = time.perf_counter()
+        # Поток записи работает только со своими буфером и сессией: новая запись их не затронет
+        capture, streaming = self.capture, self.streaming
+        stop_event = self.stop_event = threading.Event()
         
         def record():
+            started = time.perf_counter()
+            stream = None
             try:
-                sample_rate = self.config['vosk']['sample_rate'] if self.config['engine'] == 'vosk' else 16000
-                
-                self.stream = self.audio.open(
-                    format=pyaudio.paInt16,
-                    channels=1,
-                    rate=sample_rate,
+                device_rate, channels = self.capture_format(sample_rate)
+                # Микрофон пишет в родном формате, в буфер попадает mono с частотой движка
+                resampler = Resampler(device_rate, sample_rate, channels)
+                frames = device_rate * 64 // 1000
+                stream = self.audio.open(
+                    format=PA_INT16,
+                    channels=channels,
+                    rate=device_rate,
                     input=True,
-                    frames_per_buffer=1024
+                    frames_per_buffer=frames
                 )
                 
-                while self.is_recording:
-                    data = self.stream.read(1024, exception_on_overflow=False)
-                    self.frames.append(data)
+                while not stop_event.is_set():
+                    data = resampler.process(stream.read(frames, exception_on_overflow=False))
+                    if not capture.overflowed and capture.written + len(data) > capture.capacity:
+                        log(f"⚠️ Запись длиннее {max_duration} с, начало перезаписывается")
+                    capture.write(data)
+                    if streaming:
+                        streaming.feed(data)
             
             except Exception as e:
-                print(f"❌ Ошибка записи: {e}")
+                metrics.count('errors_total', stage='capture')
+                log(f"❌ Ошибка записи: {e}")
             finally:
-                if self.stream:
-                    self.stream.stop_stream()
-                    self.stream.close()
-                self.transcribe_audio()
+                if stream:
+                    stream.stop_stream()
+                    stream.close()
+                metrics.count('recordings_total')
+                metrics.observe('capture_seconds', time.perf_counter() - started)
+                metrics.count('captured_bytes_total', capture.written)
+        
+        self.record_thread = threading.Thread(target=record, daemon=True)
+        self.record_thread.start()
         
-        threading.Thread(target=record, daemon=True).start()
+        # Звук "ding" - уже после запуска записи и в фоне, чтобы не терять первые слова
+        self._play_start_sound()
     
     def stop_listening(self):
-        """Остановить запись"""
+        """Остановить запись и поставить фразу в очередь распознавания"""
         if self.is_recording:
             self.is_recording = False
+            timer = self.stage_timer = StageTimer()
+            
+            if self.input:
+                capture, recorder = self.input.end(self.session_start), None
+                metrics.count('recordings_total')
+                metrics.observe('capture_seconds', time.perf_counter() - self.session_started)
+            else:
+                # Буфер дописывается, пока поток записи не завершится; обработчик задания его дождется
+                self.stop_event.set()
+                capture, recorder = self.capture, self.record_thread
             
-            # Проиграть звук "dong" при окончании (синхронно)
+            # Проиграть звук "dong" при окончании (в фоне)
             self._play_stop_sound()
             
-            print("⏹️ Запись остановлена, обработка...")
+            log("⏹️ Запись остановлена, обработка...")
+            if self.streaming:
+                for lang, text in self.streaming.partial_results().items():
+                    if text:
+                        log(f"💬 Промежуточный ({lang}): {text}")
+            
+            job = Job(
+                self.jobs.new_seq(), capture, self.saved_hwnd, self.streaming, self.speculator,
+                timer, recorder, self.session_started, timer.start,
+                self.recording_engine, self.recording_rate
+            )
+            self.capture = self.streaming = self.speculator = None
+            self.jobs.submit(job)
     
-    def transcribe_audio(self):
-        """Транскрибировать записанное аудио"""
-        if not self.frames:
-            print("⚠️ Нет записанного аудио")
-            return
+    def transcribe_audio(self, job):
+        """Распознать фразу из очереди; текст вставит очередь в порядке записи"""
+        job.timer.mark('queue')
+        if job.recorder:
+            job.recorder.join()
+        capture = job.capture
+        if capture:
+            log(f"💾 Буфер записи: {len(capture) / 1024:.0f} КБ из {capture.capacity / 1024:.0f} КБ")
+        if not capture:
+            log("⚠️ Нет записанного аудио")
+            if job.session:
+                job.session.finish()
+            if job.speculator:
+                job.speculator.stop()
+            return None
         
-        if self.config['engine'] == 'vosk':
-            self.transcribe_vosk()
-        elif self.config['engine'] == 'google':
-            self.transcribe_google()
+        job.timer.mark('capture')
+        if job.engine == 'vosk':
+            return self.transcribe_vosk(job)
+        elif job.engine == 'google':
+            return self.transcribe_google(job)
         else:
-            print(f"❌ Неизвестный движок: {self.config['engine']}")
+            log(f"❌ Неизвестный движок: {job.engine}")
+            return None
+    
+    def deliver_text(self, job, text):
+        """Вставить текст фразы в окно, в котором начиналась ее запись"""
+        self.insert_text(text, job.hwnd)
+        job.timer.mark('paste')
+        job.timer.report()
+        metrics.observe('end_to_end_seconds', time.perf_counter() - job.stopped)
     
-    def transcribe_vosk(self):
+    def transcribe_vosk(self, job):
         """Транскрибация через Vosk с двумя моделями"""
+        try:
+            final_text, _ = self.recognize_vosk(job.capture.view(), job.session, job.speculator, job.timer)
+            if not final_text:
+                return None
+            
+            log(f"📝 Итого: {final_text}")
+            
+            stats = self.recognizer_pool.stats()
+            log(f"♻️ Пул распознавателей: попаданий {stats['hits']}, промахов {stats['misses']}, "
+                f"создание {stats['avg_construct_ms']:.0f} мс, сэкономлено ~{stats['saved_s']:.2f} с")
+            return final_text
+        
+        except Exception as e:
+            metrics.count('errors_total', stage='vosk')
+            log(f"❌ Ошибка Vosk: {e}")
+            return None
+        finally:
+            if job.speculator:
+                job.speculator.stop()
+    
+    def recognize_vosk(self, audio_data, session=None, speculator=None, timer=None):
+        """Распознать аудио и скомбинировать RU/EN: (итоговый текст или None, {язык: (text, words)})"""
+        timer = timer or StageTimer()
+        self.wait_for_models()
         if not self.vosk_model_ru and not self.vosk_model_en:
-            print("❌ Модели Vosk не загружены")
-            return
+            log("❌ Модели Vosk не загружены")
+            if session:
+                session.finish()
+            return None, {}
+        
+        if session:
+            # Чанки уже декодированы во время записи, осталась последняя фраза
+            log("🔄 Завершение потокового распознавания...")
+            results = session.finish()
+        else:
+            results = self.decode_vosk(audio_data)
+        
+        timer.mark('decode')
+        
+        text_ru, words_ru = results.get('ru', ("", []))
+        text_en, words_en = results.get('en', ("", []))
+        if self.vosk_model_ru:
+            log(f"🇷🇺 Русская: {text_ru}")
+        if self.vosk_model_en:
+            log(f"🇺🇸 Английская: {text_en}")
+        
+        # Комбинировать результаты (возможно, уже посчитаны во время паузы в речи)
+        final_text = speculator.result_for(text_ru, text_en) if speculator else None
+        if final_text:
+            log("⚡ Комбинирование выполнено заранее, во время записи")
+            metrics.count('speculative_total', result='used')
+            self.commit_combine(speculator.info)
+        elif words_ru and words_en:
+            final_text = self.combine_results(words_ru, words_en, text_ru, text_en)
+        elif text_ru:
+            final_text = text_ru
+        elif text_en:
+            final_text = text_en
+        else:
+            log("⚠️ Не удалось распознать речь")
+            return None, results
         
+        timer.mark('combine')
+        return final_text, results
+    
+    def transcribe_file(self, path):
+        """Распознать WAV-файл без вставки текста: словарь для JSONL"""
         try:
-            audio_data = b''.join(self.frames)
             sample_rate = self.config['vosk']['sample_rate']
+            audio_data = read_wav(path, sample_rate)
+            duration = len(audio_data) / 2 / sample_rate
             
-            # Распознать русской моделью
-            text_ru = ""
-            words_ru = []
-            if self.vosk_model_ru:
-                print("🔄 Распознавание русской моделью...")
-                rec_ru = KaldiRecognizer(self.vosk_model_ru, sample_rate)
-                rec_ru.SetWords(True)
-                
-                if rec_ru.AcceptWaveform(audio_data):
-                    result_ru = json.loads(rec_ru.Result())
-                else:
-                    result_ru = json.loads(rec_ru.FinalResult())
-                
-                text_ru = result_ru.get('text', '').strip()
-                words_ru = result_ru.get('result', [])
-                print(f"🇷🇺 Русская: {text_ru}")
-            
-            # Распознать английской моделью
-            text_en = ""
-            words_en = []
-            if self.vosk_model_en:
-                print("🔄 Распознавание английской моделью...")
-                rec_en = KaldiRecognizer(self.vosk_model_en, sample_rate)
-                rec_en.SetWords(True)
-                
-                if rec_en.AcceptWaveform(audio_data):
-                    result_en = json.loads(rec_en.Result())
-                else:
-                    result_en = json.loads(rec_en.FinalResult())
-                
-                text_en = result_en.get('text', '').strip()
-                words_en = result_en.get('result', [])
-                print(f"🇺🇸 Английская: {text_en}")
+            start = time.perf_counter()
+            final_text, results = self.recognize_vosk(audio_data)
+            elapsed = time.perf_counter() - start
             
-            # Комбинировать результаты
-            if words_ru and words_en:
-                final_text = self.combine_results(words_ru, words_en, text_ru, text_en)
-            elif text_ru:
-                final_text = text_ru
-            elif text_en:
-                final_text = text_en
+            return {
+                'file': path,
+                'text': final_text or '',
+                'text_ru': results.get('ru', ('', []))[0],
+                'text_en': results.get('en', ('', []))[0],
+                'duration_s': round(duration, 3),
+                'decode_s': round(elapsed, 3),
+                'rtf': round(elapsed / duration, 3) if duration else None
+            }
+        except Exception as e:
+            return {'file': path, 'error': str(e)}
+    
+    def decode_vosk(self, audio_data, parallel=None, vad=None):
+        """Распознать весь буфер обеими моделями: {язык: (text, words)}"""
+        sample_rate = self.config['vosk']['sample_rate']
+        if parallel is None:
+            parallel = self.config['vosk'].get('parallel', 'thread')
+        if vad is None:
+            vad = self.config.get('vad', {}).get('enabled', True)
+        models = {'ru': self.vosk_model_ru, 'en': self.vosk_model_en}
+        models = {lang: model for lang, model in models.items() if model}
+        
+        segments = [(0.0, audio_data)]
+        if vad:
+            segments = self.speech_segments(audio_data, sample_rate)
+        
+        tasks = [(lang, offset, chunk) for lang in models for offset, chunk in segments]
+        if parallel == 'off' or len(models) < 2:
+            log("🔄 Распознавание...")
+            outputs = [
+                decode_with_model(models[lang], chunk, sample_rate, self.recognizer_pool)
+                for lang, offset, chunk in tasks
+            ]
+        else:
+            # Обе модели декодируют одновременно
+            log(f"🔄 Параллельное распознавание ({parallel})...")
+            if parallel == 'process':
+                # memoryview не сериализуется, в другой процесс передается копия
+                futures = [
+                    self._get_decode_executor(parallel, lang).submit(_decode_in_worker, lang, bytes(chunk), sample_rate)
+                    for lang, offset, chunk in tasks
+                ]
             else:
-                print("⚠️ Не удалось распознать речь")
-                return
-            
-            print(f"📝 Итого: {final_text}")
-            self.insert_text(final_text)
+                executor = self._get_decode_executor(parallel)
+                futures = [
+                    executor.submit(decode_with_model, models[lang], chunk, sample_rate, self.recognizer_pool)
+                    for lang, offset, chunk in tasks
+                ]
+            outputs = [future.result() for future in futures]
         
-        except Exception as e:
-            print(f"❌ Ошибка Vosk: {e}")
+        results = {}
+        for lang in models:
+            parts = [(offset, output) for (task_lang, offset, _), output in zip(tasks, outputs) if task_lang == lang]
+            results[lang] = merge_segment_results(parts)
+        return results
+    
+    def _speech_spans(self, audio_data, sample_rate):
+        """Участки речи по настройкам vad из config.yaml"""
+        vad_config = self.config.get('vad', {})
+        return detect_speech(
+            audio_data, sample_rate,
+            frame_ms=vad_config.get('frame_ms', 30),
+            threshold_ratio=vad_config.get('threshold_ratio', 3.0),
+            min_rms=vad_config.get('min_rms', 300),
+            padding_ms=vad_config.get('padding_ms', 300),
+            min_silence_ms=vad_config.get('min_silence_ms', 600)
+        )
+    
+    def speech_segments(self, audio_data, sample_rate):
+        """Обрезать тишину и разбить запись на фразы: [(смещение в секундах, bytes)]"""
+        spans = self._speech_spans(audio_data, sample_rate)
+        if not spans:
+            # Порог мог не сработать на тихом или шумном микрофоне: обрезка - лишь оптимизация
+            log("🔇 VAD не нашел речь, распознается вся запись")
+            return [(0.0, audio_data)]
+        if not self.config.get('vad', {}).get('split', True):
+            spans = [(spans[0][0], spans[-1][1])]
+        
+        total = len(audio_data) // 2
+        kept = sum(end - start for start, end in spans)
+        log(f"✂️ VAD: фраз {len(spans)}, отброшено {100 * (total - kept) / max(total, 1):.0f}% сэмплов")
+        return [(start / sample_rate, audio_data[start * 2:end * 2]) for start, end in spans]
+    
+    def _get_decode_executor(self, parallel, lang=None):
+        """Пул для параллельного декодирования (создается один раз)"""
+        key = (parallel, lang) if parallel == 'process' else parallel
+        if key not in self._decode_executors:
+            if parallel == 'process':
+                # Один процесс на язык: каждый загружает копию только своей модели,
+                # иначе любой воркер со временем держал бы обе большие модели
+                self._decode_executors[key] = ProcessPoolExecutor(
+                    max_workers=1,
+                    initializer=_init_decode_worker,
+                    initargs=({lang: self.loaded_paths[lang]},)
+                )
+            else:
+                workers = self.config['vosk'].get('parallel_workers', 2)
+                self._decode_executors[key] = ThreadPoolExecutor(max_workers=workers)
+        return self._decode_executors[key]
     
-    def combine_results(self, words_ru, words_en, text_ru, text_en):
+    def deepseek_url(self):
+        return self.config.get('deepseek', {}).get('url', 'https://api.deepseek.com/v1/chat/completions')
+    
+    def google_url(self):
+        return self.config['google'].get('url', 'https://speech.googleapis.com/v1/speech:recognize')
+    
+    def google_request_config(self, encoding, sample_rate):
+        google_config = self.config['google']
+        return {
+            "encoding": encoding,
+            "sampleRateHertz": sample_rate,
+            "languageCode": google_config['language_code'],
+            "alternativeLanguageCodes": google_config['alternative_languages'],
+            "model": google_config['model'],
+            "enableAutomaticPunctuation": google_config['enable_punctuation']
+        }
+    
+    def commit_combine(self, info):
+        """Учесть комбинирование: метрика способа и сохранение ответа DeepSeek в кэш"""
+        if info.get('method'):
+            metrics.count('combine_total', method=info['method'])
+        if info.get('cache') and self.ai_cache:
+            self.ai_cache.put(*info['cache'])
+        if info.get('cache_hit') and self.ai_cache:
+            # Попадание и обновление порядка LRU - только для использованного результата
+            cached = self.ai_cache.get(info['cache_hit'])
+            metrics.count('ai_cache_total', result='miss' if cached is None else 'hit')
+    
+    def combine_results(self, words_ru, words_en, text_ru, text_en, speculative=None):
         """Комбинировать результаты двух моделей через DeepSeek AI"""
-        print(f"  🇷🇺 Русская: {text_ru}")
-        print(f"  🇺🇸 Английская: {text_en}")
+        # При заблаговременном вызове способ и ответ для кэша копятся в speculative
+        # и учитываются через commit_combine, только если результат пригодится
+        info = {} if speculative is None else speculative
+        log(f"  🇷🇺 Русская: {text_ru}")
+        log(f"  🇺🇸 Английская: {text_en}")
         
-        # Попробовать использовать DeepSeek для умного комбинирования
         deepseek_key = os.getenv('DEEPSEEK_API_KEY')
-        if deepseek_key:
+        use_ai = bool(deepseek_key) and self.config.get('deepseek', {}).get('enabled', True)
+        
+        # Быстрый путь: замена транслитерации по глоссарию без запроса в сеть
+        if self.glossary:
+            start = time.perf_counter()
+            glossary_config = self.config.get('glossary', {})
+            result = self.glossary.combine(
+                words_ru, words_en,
+                glossary_config.get('min_confidence'),
+                glossary_config.get('en_max_confidence', 0.8),
+                use_ai
+            )
+            if result:
+                log(f"  📖 Глоссарий: {result} ({(time.perf_counter() - start) * 1e6:.0f} мкс)")
+                info['method'] = 'glossary'
+                if speculative is None:
+                    self.commit_combine(info)
+                return result
+        
+        # Попробовать использовать DeepSeek для умного комбинирования
+        if use_ai:
             try:
-                print(f"  🤖 Отправка в DeepSeek AI...")
-                result = self.combine_with_ai(words_ru, words_en, deepseek_key)
+                log(f"  🤖 Отправка в DeepSeek AI...")
+                result = self.combine_with_ai(words_ru, words_en, deepseek_key, info, speculative is not None)
                 if result:
+                    info['method'] = 'deepseek'
+                    if speculative is None:
+                        self.commit_combine(info)
                     return result
             except Exception as e:
-                print(f"  ⚠️ Ошибка DeepSeek: {e}")
-        
-        # Fallback: простое комбинирование по уверенности
-        print(f"  🔄 Fallback: комбинирование по уверенности")
-        result = []
-        max_len = max(len(words_ru), len(words_en))
-        
-        for i in range(max_len):
-            if i < len(words_ru) and i < len(words_en):
-                word_ru = words_ru[i]
-                word_en = words_en[i]
-                
-                word_text_ru = word_ru.get('word', '')
-                word_text_en = word_en.get('word', '')
-                conf_ru = word_ru.get('conf', 0)
-                conf_en = word_en.get('conf', 0)
-                
-                if conf_en > conf_ru:
-                    result.append(word_text_en)
-                else:
-                    result.append(word_text_ru)
-            elif i < len(words_ru):
-                result.append(words_ru[i].get('word', ''))
-            elif i < len(words_en):
-                result.append(words_en[i].get('word', ''))
+                log(f"  ⚠️ Ошибка DeepSeek: {e}")
         
-        return ' '.join(result)
+        # Fallback: совмещение по времени слов и выбор по уверенности
+        log(f"  🔄 Fallback: совмещение по времени")
+        info['method'] = 'time_merge'
+        if speculative is None:
+            self.commit_combine(info)
+        return merge_by_time(words_ru, words_en)
     
-    def combine_with_ai(self, words_ru, words_en, api_key):
-        """Использовать DeepSeek AI для умного комбинирования"""
+    def combine_with_ai(self, words_ru, words_en, api_key, info=None, peek=False):
+        """Использовать DeepSeek AI для умного комбинирования (новый ответ для кэша - в info['cache'])"""
+        info = {} if info is None else info
         # Собрать полные фразы
         text_ru = ' '.join(w.get('word', '') for w in words_ru)
         text_en = ' '.join(w.get('word', '') for w in words_en)
         
+        # Повторяющиеся фразы берутся из кэша без запроса в сеть
+        cache_key = None
+        if self.ai_cache:
+            cache_key = AICache.key(text_ru, text_en)
+            if peek:
+                # Заблаговременный вызов не должен влиять на статистику и порядок вытеснения:
+                # попадание учтется в commit_combine, если результат пригодится
+                cached = self.ai_cache.peek(cache_key)
+                if cached is not None:
+                    info['cache_hit'] = cache_key
+            else:
+                cached = self.ai_cache.get(cache_key)
+                metrics.count('ai_cache_total', result='miss' if cached is None else 'hit')
+            if cached is not None:
+                log(f"  💾 DeepSeek (кэш): {cached} | попаданий {self.ai_cache.hit_rate():.0%}, "
+                    f"сэкономлено {self.ai_cache.saved_s:.2f} с")
+                return cached
+        
         # Подготовить детальную информацию по словам
         ru_words_detail = ', '.join(f"'{w.get('word', '')}' ({w.get('conf', 0):.2f})" for w in words_ru)
         en_words_detail = ', '.join(f"'{w.get('word', '')}' ({w.get('conf', 0):.2f})" for w in words_en)
@@ -326,8 +2477,10 @@ class AudioTranscriber:
 Верни ТОЛЬКО итоговый текст без объяснений."""
 
         try:
-            response = requests.post(
-                'https://api.deepseek.com/v1/chat/completions',
+            start = time.perf_counter()
+            response = self.http.post(
+                'DeepSeek',
+                self.deepseek_url(),
                 headers={
                     'Authorization': f'Bearer {api_key}',
                     'Content-Type': 'application/json'
@@ -339,8 +2492,7 @@ class AudioTranscriber:
                     ],
                     'temperature': 0.1,
                     'max_tokens': 150
-                },
-                timeout=10
+                }
             )
             
             if response.status_code == 200:
@@ -348,146 +2500,149 @@ class AudioTranscriber:
                 text = result['choices'][0]['message']['content'].strip()
                 # Убрать возможные кавычки
                 text = text.strip('"\'')
-                print(f"  🤖 DeepSeek: {text}")
+                latency = time.perf_counter() - start
+                metrics.observe('deepseek_seconds', latency)
+                log(f"  🤖 DeepSeek: {text} ({latency:.2f} с)")
+                if cache_key:
+                    info['cache'] = (cache_key, text, latency)
                 return text
             else:
-                print(f"  ⚠️ DeepSeek API error: {response.status_code}")
+                log(f"  ⚠️ DeepSeek API error: {response.status_code}")
                 return None
                 
         except Exception as e:
-            print(f"  ⚠️ DeepSeek request failed: {e}")
+            log(f"  ⚠️ DeepSeek request failed: {e}")
+            return None
+    
+    def google_chunks(self, audio_data, sample_rate):
+        """Разбить запись на куски не длиннее лимита Google (1 минута) по паузам, найденным VAD"""
+        limit = int(self.config['google'].get('max_request_s', 55) * sample_rate)
+        total = len(audio_data) // 2
+        spans = self._speech_spans(audio_data, sample_rate) if self.config.get('vad', {}).get('enabled', True) else []
+        if not spans:
+            if self.config.get('vad', {}).get('enabled', True):
+                log("🔇 VAD не нашел речь, отправляется вся запись")
+            spans = [(0, total)]
+        
+        # Фразы собираются в куски подряд; фраза длиннее лимита режется по лимиту
+        pieces = []
+        for start, end in spans:
+            while end - start > limit:
+                pieces.append((start, start + limit))
+                start += limit
+            pieces.append((start, end))
+        chunks = [list(pieces[0])]
+        for start, end in pieces[1:]:
+            if end - chunks[-1][0] <= limit:
+                chunks[-1][1] = end
+            else:
+                chunks.append([start, end])
+        
+        kept = sum(end - start for start, end in chunks)
+        if kept < total:
+            log(f"✂️ VAD: отброшено {100 * (total - kept) / max(total, 1):.0f}% сэмплов")
+        if len(chunks) > 1:
+            log(f"✂️ Запись длиннее {limit / sample_rate:.0f} с: {len(chunks)} запросов в Google")
+        return [audio_data[start * 2:end * 2] for start, end in chunks]
+    
+    def google_text(self, response):
+        """Текст из ответа speech:recognize: результаты идут по порядку частей аудио"""
+        if response.status_code != 200:
+            log(f"❌ Ошибка API: {response.status_code} - {response.text}")
             return None
+        results = response.json().get('results') or []
+        parts = [r['alternatives'][0]['transcript'].strip() for r in results if r.get('alternatives')]
+        return ' '.join(part for part in parts if part) or None
+    
+    def google_request(self, audio_data, sample_rate, api_key):
+        """Один запрос speech:recognize (аудио не длиннее минуты), вернуть текст или None"""
+        google_config = self.config['google']
+        encoding, audio_content = encode_audio(audio_data, sample_rate, google_config.get('encoding', 'LINEAR16'))
+        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+        data = {
+            "config": self.google_request_config(encoding, sample_rate),
+            "audio": {
+                "content": audio_base64
+            }
+        }
+        
+        # Ответ на длинную диктовку приходит дольше: ожидание растет с длиной аудио
+        minutes = len(audio_data) / 2 / sample_rate / 60
+        timeout = (self.http.timeout[0], self.http.timeout[1] + minutes * google_config.get('timeout_per_minute_s', 30))
+        
+        started = time.perf_counter()
+        response = self.http.post('Google', self.google_url(), params={'key': api_key}, json=data, timeout=timeout)
+        elapsed = time.perf_counter() - started
+        metrics.count('upload_bytes_total', len(audio_base64), api='Google', mode='single')
+        metrics.observe('upload_seconds', elapsed, api='Google', mode='single')
+        log(f"📤 Google: аудио {len(audio_data) / 1024:.0f} КБ -> {encoding} {len(audio_content) / 1024:.0f} КБ, "
+            f"base64 {len(audio_base64) / 1024:.0f} КБ, запрос {elapsed * 1000:.0f} мс")
+        return self.google_text(response)
     
-    def transcribe_google(self):
+    def transcribe_google(self, job):
         """Транскрибация через Google Speech-to-Text (онлайн)"""
+        timer = job.timer
+        upload = job.session
         try:
-            # Создать WAV в памяти
-            wav_buffer = io.BytesIO()
-            wf = wave.open(wav_buffer, 'wb')
-            wf.setnchannels(1)
-            wf.setsampwidth(self.audio.get_sample_size(pyaudio.paInt16))
-            wf.setframerate(16000)
-            wf.writeframes(b''.join(self.frames))
-            wf.close()
-            
-            audio_content = wav_buffer.getvalue()
-            
-            # Получить API ключ
-            api_key = os.getenv('GOOGLE_API_KEY')
-            if not api_key:
-                print("❌ GOOGLE_API_KEY не найден в .env файле")
-                return
-            
-            url = f"https://speech.googleapis.com/v1/speech:recognize?key={api_key}"
-            audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-            
-            google_config = self.config['google']
-            data = {
-                "config": {
-                    "encoding": "LINEAR16",
-                    "sampleRateHertz": 16000,
-                    "languageCode": google_config['language_code'],
-                    "alternativeLanguageCodes": google_config['alternative_languages'],
-                    "model": google_config['model'],
-                    "enableAutomaticPunctuation": google_config['enable_punctuation']
-                },
-                "audio": {
-                    "content": audio_base64
-                }
-            }
+            sample_rate = job.rate
+            text = None
+            response = None
             
-            print("🔄 Отправка на Google Speech-to-Text...")
-            response = requests.post(url, json=data, timeout=10)
+            if upload:
+                # Аудио уже отправлено во время записи, осталось закрыть тело запроса
+                response = upload.finish()
+                if response is None or response.status_code != 200:
+                    reason = upload.error if response is None else f"HTTP {response.status_code}"
+                    log(f"⚠️ Потоковая отправка не удалась ({reason}), повтор обычными запросами")
+                    response = None
+                else:
+                    tail = upload.body_done - upload.stopped
+                    metrics.count('upload_bytes_total', upload.sent_bytes, api='Google', mode='stream')
+                    metrics.observe('upload_seconds', tail, api='Google', mode='stream')
+                    log(f"📤 Google: аудио {upload.audio_bytes / 1024:.0f} КБ, отправлено {upload.sent_bytes / 1024:.0f} КБ "
+                        f"по ходу записи, досылка после остановки {tail * 1000:.0f} мс, "
+                        f"ответ {(upload.received - upload.body_done) * 1000:.0f} мс")
+                    text = self.google_text(response)
             
-            if response.status_code == 200:
-                result = response.json()
+            if response is None:
+                # Получить API ключ
+                api_key = os.getenv('GOOGLE_API_KEY')
+                if not api_key:
+                    log("❌ GOOGLE_API_KEY не найден в .env файле")
+                    return
                 
-                if 'results' in result and result['results']:
-                    text = result['results'][0]['alternatives'][0]['transcript']
-                    print(f"📝 Распознано: {text}")
-                    self.insert_text(text)
-                else:
-                    print("⚠️ Не удалось распознать речь")
-            else:
-                print(f"❌ Ошибка API: {response.status_code} - {response.text}")
+                chunks = self.google_chunks(job.capture.view(), sample_rate)
+                log("🔄 Отправка на Google Speech-to-Text...")
+                # Куски длинной записи отправляются параллельно, текст склеивается по порядку
+                with ThreadPoolExecutor(max_workers=min(len(chunks), 4)) as executor:
+                    texts = list(executor.map(lambda chunk: self.google_request(chunk, sample_rate, api_key), chunks))
+                text = ' '.join(part for part in texts if part) or None
+            
+            if text:
+                timer.mark('recognize')
+                log(f"📝 Распознано: {text}")
+                return text
+            log("⚠️ Не удалось распознать речь")
         
         except Exception as e:
-            print(f"❌ Ошибка Google Speech: {e}")
+            metrics.count('errors_total', stage='google')
+            log(f"❌ Ошибка Google Speech: {e}")
     
-    def insert_text(self, text):
-        """Вставить текст в активное окно"""
+    def insert_text(self, text, hwnd=None):
+        """Вставить текст в окно hwnd (None - предыдущее окно)"""
         try:
-            import time
-            
-            # Сохранить текущее содержимое буфера обмена
-            try:
-                old_clipboard = pyperclip.paste()
-            except:
-                old_clipboard = None
-            
-            # Копировать в буфер обмена
-            pyperclip.copy(text + ' ')
-            time.sleep(0.1)
-            
-            # Восстановить фокус на сохраненное окно
-            if self.saved_hwnd:
-                try:
-                    import ctypes
-                    print(f"🔄 Восстановление фокуса на окно: {self.saved_hwnd}")
-                    
-                    ctypes.windll.user32.BringWindowToTop(self.saved_hwnd)
-                    result = ctypes.windll.user32.SetForegroundWindow(self.saved_hwnd)
-                    
-                    if result == 0:
-                        print(f"⚠️ SetForegroundWindow вернул 0, используем Alt+Tab")
-                        pyautogui.hotkey('alt', 'tab')
-                        time.sleep(0.3)
-                    else:
-                        time.sleep(0.2)
-                        print(f"✅ Фокус восстановлен")
-                except Exception as e:
-                    print(f"⚠️ Ошибка восстановления фокуса: {e}")
-                    print(f"🔄 Переключение через Alt+Tab")
-                    pyautogui.hotkey('alt', 'tab')
-                    time.sleep(0.3)
-            else:
-                print(f"🔄 Переключение на предыдущее окно через Alt+Tab")
-                pyautogui.hotkey('alt', 'tab')
-                time.sleep(0.3)
-            
-            # Вставить текст
-            pyautogui.hotkey('ctrl', 'v')
-            print("✅ Текст вставлен")
-            
-            # Восстановить старое содержимое буфера обмена
-            time.sleep(0.1)
-            if old_clipboard is not None:
-                try:
-                    pyperclip.copy(old_clipboard)
-                    print("♻️ Буфер обмена восстановлен")
-                except:
-                    pass
-        
+            self.inserter.insert(text + ' ', hwnd)
         except Exception as e:
-            print(f"❌ Ошибка вставки текста: {e}")
+            metrics.count('errors_total', stage='paste')
+            log(f"❌ Ошибка вставки текста: {e}")
     
     def _play_start_sound(self):
         """Проиграть звук начала записи"""
-        try:
-            # Двойной beep для надежности
-            winsound.Beep(1200, 100)
-            winsound.Beep(1400, 100)
-        except Exception as e:
-            print(f"⚠️ Не удалось проиграть звук: {e}")
+        self.notifier.notify(START_TONES)
     
     def _play_stop_sound(self):
         """Проиграть звук окончания записи"""
-        try:
-            # Двойной beep для надежности
-            winsound.Beep(1000, 100)
-            winsound.Beep(800, 150)
-        except Exception as e:
-            print(f"⚠️ Не удалось проиграть звук: {e}")
+        self.notifier.notify(STOP_TONES)
     
     def toggle_recording(self):
         """Переключить состояние записи"""
@@ -497,7 +2652,11 @@ class AudioTranscriber:
             self.start_listening()
 
 
-def main():
+def run_hotkey():
+    """Фоновый режим: запись по горячей клавише и вставка текста в активное окно"""
+    import keyboard  # Изменено с pynput на keyboard
+    
+    startup = time.perf_counter()
     print("=" * 50)
     print("🎙️ ТРАНСКРИБАЦИЯ АУДИО В ТЕКСТ")
     print("=" * 50)
@@ -509,26 +2668,46 @@ def main():
     transcriber = AudioTranscriber()
     
     def on_activate_record():
-        print("🔥 Горячая клавиша нажата!")
+        log("🔥 Горячая клавиша нажата!")
         transcriber.toggle_recording()
     
     # Регистрация горячих клавиш через keyboard (более надежно)
     try:
         keyboard.add_hotkey('alt+`', on_activate_record)
         print("✅ Горячая клавиша Alt+` зарегистрирована")
+        metrics.observe('startup_seconds', time.perf_counter() - startup)
+        print(f"⏱️ Горячая клавиша готова через {time.perf_counter() - startup:.2f} с после запуска")
     except Exception as e:
         print(f"❌ Ошибка регистрации горячей клавиши: {e}")
     
     # Держать программу запущенной
     try:
-        import time
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         print("\n👋 Выход из программы")
         transcriber.stop_listening()
+        transcriber.close_input()
         transcriber.audio.terminate()
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Голосовой ввод текста")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    batch = subparsers.add_parser('batch', help="Распознать WAV-файлы и папки, результат в JSONL")
+    batch.add_argument('paths', nargs='+', help="WAV-файлы или папки с ними")
+    batch.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                       help="Число процессов (каждый загружает свои модели)")
+    batch.add_argument('--output', '-o', help="Файл JSONL (по умолчанию stdout)")
+    batch.add_argument('--offline', action='store_true', help="Не обращаться к DeepSeek")
+    
+    args = parser.parse_args()
+    if args.command == 'batch':
+        run_batch(args)
+    else:
+        run_hotkey()
+
+
 if __name__ == "__main__":
     main()